@@ -2,21 +2,50 @@
 Play Virtual Consultant API - Main application.
 """
 
+import argparse
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 from dotenv import load_dotenv
 from pathlib import Path
 
-from core import SessionManager, WebSocketHandler
+from core import SessionManager, WebSocketHandler, start_logging, stop_logging, get_logging_stats
+from external.mcp_server import (
+    start_http_client, close_http_client, catalog_cache, customer_cache, get_backend_stats
+)
+from external.llm import close_llm, get_usage_stats
+from external.prompts import PROMPT_VERSION, SYSTEM_PROMPT_HASH
+from external.scheduler import llm_scheduler
+from external.prefetch import get_prefetch_stats
+from external.answer_cache import answer_cache
+from external.metrics import Gauge, render_metrics
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open and close process-wide resources together with the app."""
+    start_logging()
+    await start_http_client()
+    await session_manager.start_sweeper()
+    try:
+        yield
+    finally:
+        await session_manager.stop_sweeper()
+        await close_llm()
+        await close_http_client()
+        stop_logging()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Play Virtual Consultant API",
     description="AI-powered virtual consultant for Play telecom services",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for Next.js frontend
@@ -37,6 +66,11 @@ if static_path.exists():
 session_manager = SessionManager()
 ws_handler = WebSocketHandler(session_manager)
 
+# Wartości odczytywane przy każdym pobraniu /metrics
+Gauge("chat_active_sessions", "Live sessions in this process", session_manager.get_active_count)
+Gauge("llm_scheduler_active", "LLM calls in progress", lambda: llm_scheduler.active)
+Gauge("llm_scheduler_queued", "LLM calls waiting for a slot", lambda: llm_scheduler.get_stats()["queued"])
+
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -79,16 +113,38 @@ async def health_check():
     Health check endpoint.
     
     Returns:
-        Status information and active session count
+        Status information and aggregate session statistics
     """
     return {
         "status": "healthy",
         "service": "Play Virtual Consultant",
         "active_sessions": session_manager.get_active_count(),
-        "session_stats": session_manager.get_all_stats()
+        "sessions": session_manager.get_aggregate_stats(),
+        "catalog_cache": catalog_cache.get_stats(),
+        "customer_cache": customer_cache.get_stats(),
+        "backend": get_backend_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "llm_usage": get_usage_stats(),
+        "prefetch": get_prefetch_stats(),
+        "answer_cache": answer_cache.get_stats(),
+        "prompt": {"version": PROMPT_VERSION, "hash": SYSTEM_PROMPT_HASH},
+        "websocket": ws_handler.get_stats(),
+        "logging": get_logging_stats()
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metrics endpoint (Prometheus text format, per worker process).
+    
+    Returns:
+        Turn latency and time to first token, LLM calls, queue wait,
+        tokens, per-tool and per-endpoint backend latency and errors
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/info")
 async def api_info():
     """
@@ -110,18 +166,36 @@ async def api_info():
         "endpoints": {
             "websocket": "/ws",
             "health": "/health",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
 
 
-def main():
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command line options of the server."""
+    parser = argparse.ArgumentParser(description="Play Virtual Consultant API")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        help="Number of worker processes (production); sessions are shared via SESSION_STORE"
+    )
+    parser.add_argument("--no-reload", action="store_true", help="Disable auto-reload (single worker)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main entry point."""
     load_dotenv()
+    args = parse_args(argv)
+    # Auto-reload tylko w trybie deweloperskim (jeden worker)
+    reload = args.workers == 1 and not args.no_reload
     
     print("=" * 80)
     print("🚀 Play Virtual Consultant API - JSON Streaming Mode")
     print("=" * 80)
+    print(f"⚙️  Workers: {args.workers} | Reload: {reload}")
     print("📍 WebSocket: ws://localhost:8000/ws")
     print("🌐 HTML Test Client: http://localhost:8000")
     print("💚 Health Check: http://localhost:8000/health")
@@ -134,11 +208,12 @@ def main():
     print("=" * 80)
     
     uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000, 
+        "app:app", 
+        host=args.host, 
+        port=args.port, 
         log_level="info",
-        reload=True  # Auto-reload on code changes
+        workers=args.workers,
+        reload=reload  # Auto-reload on code changes
     )
 
 
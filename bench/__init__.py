@@ -0,0 +1,5 @@
+"""
+Offline benchmark harness: fake LLM, fake sales backend and a /ws load driver.
+
+Run with: python -m bench.run --connections 50
+"""
@@ -0,0 +1,141 @@
+"""
+Local stand-in for the sales backend (SALES_API_URL) used in benchmarks.
+"""
+
+import asyncio
+import itertools
+from typing import List, Optional
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+PRODUCT_TYPES = ("MOBILE", "INTERNET", "TV")
+
+
+class OrderRequest(BaseModel):
+    customerId: int
+    componentCatalogIds: List[int]
+
+
+def make_catalog(items: int) -> List[dict]:
+    """Catalog with `items` products spread over the product types."""
+    return [
+        {
+            "id": index,
+            "type": PRODUCT_TYPES[index % len(PRODUCT_TYPES)],
+            "parameterName": "GB" if index % 3 == 0 else "Mb/s" if index % 3 == 1 else "kanałów",
+            "parameterValue": str(10 * index),
+            "priceMin": f"{20 + index % 50}.00",
+            "priceMax": f"{40 + index % 80}.99",
+            "status": "ACTIVE",
+        }
+        for index in range(1, items + 1)
+    ]
+
+
+def make_customer(pesel: str, services: int) -> dict:
+    """Customer with `services` active services; the id is derived from the PESEL."""
+    customer_id = int(pesel[-6:]) + 1
+    return {
+        "id": customer_id,
+        "firstName": "Jan",
+        "lastName": f"Testowy{customer_id}",
+        "pesel": pesel,
+        "email": f"jan{customer_id}@example.com",
+        "status": "ACTIVE",
+        "type": "INDIVIDUAL",
+        "services": [
+            {
+                "serviceName": f"Usługa {index}",
+                "type": PRODUCT_TYPES[index % len(PRODUCT_TYPES)],
+                "status": "ACTIVE",
+                "sim": index % 2 == 0,
+                "simNumber": f"8948{customer_id:08d}{index:02d}",
+                "simType": "ESIM",
+                "components": [
+                    {"name": "Pakiet danych", "parameterName": "GB", "parameterValue": str(20 * (index + 1))}
+                ],
+            }
+            for index in range(services)
+        ],
+    }
+
+
+def make_invoices(customer_id: int, count: int) -> List[dict]:
+    """`count` monthly invoices, the newest one unpaid."""
+    return [
+        {
+            "id": customer_id * 100 + index,
+            "status": "UNPAID" if index == count - 1 else "PAID",
+            "priceGross": f"{59 + index % 20}.99",
+            "billingPeriodStartDate": f"2025-{index % 12 + 1:02d}-01T00:00:00Z",
+            "billingPeriodEndDate": f"2025-{index % 12 + 1:02d}-28T00:00:00Z",
+            "createDate": f"2025-{index % 12 + 1:02d}-28T12:00:00Z",
+        }
+        for index in range(count)
+    ]
+
+
+def create_fake_backend(
+    latency: float = 0.05,
+    catalog_items: int = 30,
+    services: int = 3,
+    invoices: int = 6
+) -> FastAPI:
+    """
+    Build the fake backend app.
+    
+    Args:
+        latency: Seconds added to every request
+        catalog_items: Number of products in the catalog
+        services: Active services per customer
+        invoices: Invoices per customer
+        
+    Returns:
+        FastAPI application serving customer, component-catalog, order and invoices
+    """
+    app = FastAPI(title="Fake sales backend")
+    catalog = make_catalog(catalog_items)
+    order_ids = itertools.count(1)
+    app.state.requests = {"customer": 0, "component-catalog": 0, "order": 0, "invoices": 0}
+    
+    @app.get("/customer")
+    async def customer(pesel: str):
+        app.state.requests["customer"] += 1
+        await asyncio.sleep(latency)
+        return make_customer(pesel, services)
+    
+    @app.get("/component-catalog")
+    async def component_catalog(type: Optional[str] = None):
+        app.state.requests["component-catalog"] += 1
+        await asyncio.sleep(latency)
+        return [item for item in catalog if type is None or item["type"] == type]
+    
+    @app.post("/order")
+    async def order(request: OrderRequest):
+        app.state.requests["order"] += 1
+        await asyncio.sleep(latency)
+        order_id = next(order_ids)
+        return {
+            "id": order_id,
+            "customerId": request.customerId,
+            "status": "NEW",
+            "createDate": "2025-10-01T12:00:00Z",
+            "orderItems": [
+                {
+                    "id": order_id * 100 + index,
+                    "componentCatalogId": catalog_id,
+                    "componentCatalogName": f"Produkt {catalog_id}",
+                    "status": "NEW",
+                }
+                for index, catalog_id in enumerate(request.componentCatalogIds)
+            ],
+        }
+    
+    @app.get("/invoices")
+    async def invoices_for(customerId: int):
+        app.state.requests["invoices"] += 1
+        await asyncio.sleep(latency)
+        return make_invoices(customerId, invoices)
+    
+    return app
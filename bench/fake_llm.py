@@ -0,0 +1,142 @@
+"""
+Scripted chat model standing in for ChatOpenAI in benchmarks.
+"""
+
+import asyncio
+import re
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from external.prefetch import find_pesels
+from external.prompts import TOOL_PROCESSING_PROMPT
+
+# Początek wiadomości z wynikami narzędzi (tryb markerów)
+TOOL_RESULTS_PREFIX = TOOL_PROCESSING_PROMPT.split("{tool_results}")[0]
+
+CATALOG_KEYWORDS = re.compile(r"ofert|katalog|cen|kosztuj|pakiet", re.IGNORECASE)
+ORDER_KEYWORDS = re.compile(r"zamawiam|zamów|zamow", re.IGNORECASE)
+CUSTOMER_ID_PATTERN = re.compile(r"customer_id=(\d+)|ID klienta: (\d+)")
+
+ANSWER_WORDS = (
+    "Jasne,", "mamy", "dla", "Ciebie", "kilka", "propozycji", "w", "atrakcyjnych", "cenach.",
+    "Internet", "światłowodowy", "do", "1", "Gb/s", "oraz", "pakiet", "telewizji", "z", "abonamentem.",
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model replying with scripted tool markers and filler answers.
+    
+    The first reply of a turn is a tool marker chosen from the user text
+    (PESEL -> CHECK_CUSTOMER / CHECK_INVOICES_BY_PESEL, order words ->
+    CREATE_ORDER, offer words -> GET_CATALOG); after tool results it
+    streams a plain answer. Timing follows first_token_delay and
+    tokens_per_second, so the service sees realistic streams.
+    """
+    
+    first_token_delay: float = 0.3
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+    tool_markers: bool = True
+    
+    @property
+    def _llm_type(self) -> str:
+        return "fake-scripted"
+    
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeChatModel":
+        """Native tools are not emulated; the model answers with text markers."""
+        return self
+    
+    def script(self, messages: List[BaseMessage]) -> str:
+        """
+        Choose the reply for a conversation.
+        
+        Args:
+            messages: Conversation sent to the model
+            
+        Returns:
+            Reply text
+        """
+        last = messages[-1]
+        if isinstance(last, ToolMessage) or not self.tool_markers:
+            return self.answer()
+        if isinstance(last, HumanMessage) and last.content.startswith(TOOL_RESULTS_PREFIX):
+            return self.answer()
+        
+        text = last.content
+        pesels = find_pesels(text)
+        if pesels:
+            if "faktur" in text.lower():
+                return f"[CHECK_INVOICES_BY_PESEL: {pesels[0]}]"
+            return f"[CHECK_CUSTOMER: {pesels[0]}]"
+        if ORDER_KEYWORDS.search(text):
+            return f"[CREATE_ORDER: {self._customer_id(messages)}, 1, 2]"
+        if CATALOG_KEYWORDS.search(text):
+            return "[GET_CATALOG]"
+        return self.answer()
+    
+    def answer(self) -> str:
+        """Filler answer of answer_tokens words."""
+        return " ".join(ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(self.answer_tokens))
+    
+    @staticmethod
+    def _customer_id(messages: List[BaseMessage]) -> str:
+        """Customer id from earlier tool results (or a placeholder)."""
+        for message in reversed(messages):
+            match = CUSTOMER_ID_PATTERN.search(message.content)
+            if match:
+                return match.group(1) or match.group(2)
+        return "1"
+    
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        """Split a reply into stream tokens (markers stay in small pieces, like real streams)."""
+        return re.findall(r"\S{1,4}|\s+", text)
+    
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.script(messages)))])
+    
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        for token in self._tokens(self.script(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+    
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tokens = self._tokens(self.script(messages))
+        input_tokens = sum(len(message.content) for message in messages) // 4
+        
+        await asyncio.sleep(self.first_token_delay)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for index, token in enumerate(tokens):
+            if index and interval:
+                await asyncio.sleep(interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens),
+            }
+        ))
@@ -0,0 +1,157 @@
+"""
+Load driver: many /ws connections running scripted multi-turn dialogs.
+"""
+
+import asyncio
+import json
+import math
+import time
+from typing import Dict, List, Optional
+
+import websockets
+
+from external.prefetch import PESEL_WEIGHTS
+
+# {pesel} jest podmieniany na osobny, poprawny PESEL dla każdego połączenia
+DIALOGS = (
+    ("Cześć, jakie macie oferty internetu?", "A ile kosztuje pakiet TV?", "Dzięki, to wszystko"),
+    ("Mój PESEL to {pesel}, jakie mam usługi?", "Pokaż moje faktury, PESEL {pesel}"),
+    ("Dzień dobry, PESEL {pesel}", "Jakie macie oferty?", "Zamawiam pierwszy pakiet"),
+    ("Hej, czym się zajmujecie?", "Jakie są ceny abonamentów?"),
+)
+
+
+def make_pesel(number: int) -> str:
+    """
+    Build a valid PESEL (correct control digit) from a sequence number.
+    
+    Args:
+        number: Any non-negative integer
+        
+    Returns:
+        11-digit PESEL
+    """
+    base = f"900101{number % 10000:04d}"
+    total = sum(int(digit) * weight for digit, weight in zip(base, PESEL_WEIGHTS))
+    return base + str((10 - total % 10) % 10)
+
+
+class TurnResult:
+    """Timing of one user turn as seen by the client."""
+    
+    __slots__ = ("first_chunk", "latency", "chars", "frames", "error")
+    
+    def __init__(self):
+        self.first_chunk: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.chars = 0
+        self.frames = 0
+        self.error: Optional[str] = None
+
+
+async def _run_turn(ws, text: str, timeout: float) -> TurnResult:
+    """Send one message and read the streamed answer."""
+    result = TurnResult()
+    started = time.perf_counter()
+    await ws.send(text)
+    
+    while True:
+        message = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+        kind = message.get("type")
+        if kind == "stream_chunk":
+            if result.first_chunk is None:
+                result.first_chunk = time.perf_counter() - started
+            result.chars += len(message.get("content", ""))
+            result.frames += 1
+        elif kind == "stream_end":
+            result.latency = time.perf_counter() - started
+            return result
+        elif kind == "error":
+            result.error = message.get("code") or "error"
+            result.latency = time.perf_counter() - started
+            return result
+
+
+async def run_connection(
+    url: str,
+    index: int,
+    dialog: tuple,
+    release: asyncio.Event,
+    counter: Dict[str, int],
+    think_time: float,
+    timeout: float
+) -> List[TurnResult]:
+    """
+    Run one dialog on its own connection.
+    
+    The connection stays open until `release` is set, so memory can be
+    measured with every connection alive.
+    """
+    pesel = make_pesel(index)
+    results = []
+    async with websockets.connect(url, max_size=None) as ws:
+        # Komunikat "session" i powitanie
+        await asyncio.wait_for(ws.recv(), timeout)
+        await asyncio.wait_for(ws.recv(), timeout)
+        counter["open"] += 1
+        
+        for text in dialog:
+            try:
+                results.append(await _run_turn(ws, text.format(pesel=pesel), timeout))
+            except Exception as e:
+                failed = TurnResult()
+                failed.error = type(e).__name__
+                results.append(failed)
+                break
+            if think_time:
+                await asyncio.sleep(think_time)
+        
+        counter["done"] += 1
+        await release.wait()
+    return results
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile (0 for no values)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(results: List[TurnResult], wall_time: float) -> dict:
+    """
+    Aggregate turn results.
+    
+    Returns:
+        Dictionary with counts, TTFC / latency percentiles and throughput
+    """
+    ok = [r for r in results if r.error is None and r.latency is not None]
+    ttfc = [r.first_chunk for r in ok if r.first_chunk is not None]
+    latency = [r.latency for r in ok]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r.error:
+            errors[r.error] = errors.get(r.error, 0) + 1
+    
+    def dist(values):
+        return {
+            "p50": round(percentile(values, 50), 3),
+            "p90": round(percentile(values, 90), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(max(values), 3) if values else 0.0,
+        }
+    
+    frames = sum(r.frames for r in ok)
+    return {
+        "turns": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "wall_seconds": round(wall_time, 2),
+        "turns_per_second": round(len(ok) / wall_time, 2) if wall_time else 0.0,
+        "chars_per_second": round(sum(r.chars for r in ok) / wall_time, 1) if wall_time else 0.0,
+        "ttfc_seconds": dist(ttfc),
+        "latency_seconds": dist(latency),
+        "frames_per_turn": round(frames / len(ok), 1) if ok else 0.0,
+    }
@@ -0,0 +1,178 @@
+"""
+Benchmark runner: starts the fake backend and the app in-process and drives /ws load.
+
+    python -m bench.run --connections 100 --llm-first-token 0.3 --llm-tps 50
+    
+Everything (fake backend, app, load driver) shares one event loop, so
+absolute numbers are pessimistic; the report is meant for comparing runs
+of the same configuration before and after a change.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import time
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse benchmark options."""
+    parser = argparse.ArgumentParser(description="Offline benchmark of the /ws chat service")
+    parser.add_argument("--connections", type=int, default=50, help="Concurrent WebSocket connections")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which connections are opened")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pause between turns of a dialog")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-message receive timeout")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Fake LLM first token delay (s)")
+    parser.add_argument("--llm-tps", type=float, default=50.0, help="Fake LLM tokens per second")
+    parser.add_argument("--llm-answer-tokens", type=int, default=60, help="Fake LLM answer length (words)")
+    parser.add_argument("--backend-latency", type=float, default=0.05, help="Fake backend latency (s)")
+    parser.add_argument("--catalog-items", type=int, default=30, help="Products in the fake catalog")
+    parser.add_argument("--services", type=int, default=3, help="Services per fake customer")
+    parser.add_argument("--invoices", type=int, default=6, help="Invoices per fake customer")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def rss_bytes() -> int:
+    """Current resident memory of the process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def free_port() -> int:
+    """Pick a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_server(app, port: int):
+    """Serve an ASGI app on localhost in the current event loop."""
+    import uvicorn
+    
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    # Sygnały obsługuje runner, nie serwery
+    server.install_signal_handlers = lambda: None
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def run(args: argparse.Namespace) -> dict:
+    """Run one benchmark and return the report."""
+    backend_port = free_port()
+    app_port = free_port()
+    
+    # Konfiguracja musi być ustawiona przed importem aplikacji
+    os.environ["SALES_API_URL"] = f"http://127.0.0.1:{backend_port}"
+    os.environ.setdefault("SESSION_STORE", "memory")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("SCW_SECRET_KEY", "bench")
+    # Bez logu każdego zapytania do fałszywego backendu
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    
+    from bench.fake_backend import create_fake_backend
+    from bench.fake_llm import FakeChatModel
+    from bench.load import DIALOGS, run_connection, summarize
+    from external.llm import set_llm
+    import app as service
+    
+    backend = create_fake_backend(
+        latency=args.backend_latency,
+        catalog_items=args.catalog_items,
+        services=args.services,
+        invoices=args.invoices
+    )
+    backend_server, backend_task = await start_server(backend, backend_port)
+    app_server, app_task = await start_server(service.app, app_port)
+    set_llm(FakeChatModel(
+        first_token_delay=args.llm_first_token,
+        tokens_per_second=args.llm_tps,
+        answer_tokens=args.llm_answer_tokens
+    ))
+    
+    url = f"ws://127.0.0.1:{app_port}/ws"
+    release = asyncio.Event()
+    counter = {"open": 0, "done": 0}
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    
+    async def delayed(index: int):
+        await asyncio.sleep(args.ramp * index / max(1, args.connections))
+        return await run_connection(
+            url, index, DIALOGS[index % len(DIALOGS)], release, counter,
+            args.think_time, args.timeout
+        )
+    
+    connections = [asyncio.create_task(delayed(i)) for i in range(args.connections)]
+    try:
+        while counter["done"] + sum(task.done() for task in connections) < args.connections:
+            await asyncio.sleep(0.05)
+        wall_time = time.perf_counter() - started
+        
+        # Pamięć mierzona, gdy wszystkie połączenia i sesje nadal istnieją
+        rss_after = rss_bytes()
+        sessions = service.session_manager.get_aggregate_stats()
+        health = service.ws_handler.get_stats()
+    finally:
+        release.set()
+        results = []
+        for outcome in await asyncio.gather(*connections, return_exceptions=True):
+            if isinstance(outcome, list):
+                results.extend(outcome)
+        app_server.should_exit = True
+        backend_server.should_exit = True
+        await asyncio.gather(app_task, backend_task)
+    
+    report = summarize(results, wall_time)
+    report["config"] = vars(args)
+    report["connections_failed"] = sum(1 for task in connections if task.exception() is not None)
+    report["memory"] = {
+        "rss_delta_mb": round((rss_after - rss_before) / (1024 * 1024), 2),
+        "rss_per_connection_kb": round((rss_after - rss_before) / 1024 / max(1, args.connections), 1),
+        "session_history_mb": sessions["estimated_memory_mb"],
+    }
+    report["stream"] = health["stream"]
+    report["backend_requests"] = dict(backend.state.requests)
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Human-readable summary of a report."""
+    ttfc, latency, memory = report["ttfc_seconds"], report["latency_seconds"], report["memory"]
+    return "\n".join([
+        f"turns: {report['ok']}/{report['turns']} ok, errors: {report['errors'] or 'none'}, "
+        f"failed connections: {report['connections_failed']}",
+        f"throughput: {report['turns_per_second']} turns/s, {report['chars_per_second']} chars/s "
+        f"over {report['wall_seconds']} s",
+        f"time to first chunk: p50={ttfc['p50']} p90={ttfc['p90']} p99={ttfc['p99']} max={ttfc['max']}",
+        f"turn latency:        p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}",
+        f"frames per turn: {report['frames_per_turn']}",
+        f"memory: rss +{memory['rss_delta_mb']} MB ({memory['rss_per_connection_kb']} KB/connection, "
+        f"incl. driver), session history {memory['session_history_mb']} MB",
+        f"backend requests: {report['backend_requests']}",
+    ])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,31 @@
 Core functionality for the Play virtual consultant API.
 """
 
-from .logging import log_colored, log_history, log_streaming_progress
-from .session import SessionManager
+from .logging import (
+    configure_logging, start_logging, stop_logging, get_logging_stats,
+    log_colored, log_history, log_streaming_progress, log_exception, log_text
+)
+from .session import SessionLimitError, SessionManager
+from .session_store import SessionStore, InMemorySessionStore, SQLiteSessionStore, create_session_store
+from .stream_writer import CoalescingStreamWriter
 from .websocket import WebSocketHandler
 
 __all__ = [
+    'configure_logging',
+    'start_logging',
+    'stop_logging',
+    'get_logging_stats',
     'log_colored',
     'log_history',
     'log_streaming_progress',
+    'log_exception',
+    'log_text',
     'SessionManager',
+    'SessionLimitError',
+    'SessionStore',
+    'InMemorySessionStore',
+    'SQLiteSessionStore',
+    'create_session_store',
+    'CoalescingStreamWriter',
     'WebSocketHandler',
 ]
\ No newline at end of file
@@ -1,12 +1,304 @@
 """
 Logging utilities for the Play virtual consultant API.
+
+Log calls only build a small event tuple and put it on a queue; a
+background thread formats and writes it. By default every event is one
+JSON line. LOG_PRETTY=1 switches the writer to the decorated console
+output (emoji, frames, history tables) used during development.
 """
 
+import atexit
 import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import traceback
 from datetime import datetime
 
+# Poziomy logowania
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+
+def _parse_sampling(spec: str) -> dict:
+    """
+    Parse a sampling spec like "history=0.1,streaming=0.05".
+    
+    Args:
+        spec: Comma separated kind=rate pairs
+        
+    Returns:
+        Dictionary event kind -> keep probability
+    """
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            kind, rate = item.split("=", 1)
+            rates[kind.strip()] = float(rate)
+    return rates
+
+
+LOG_PRETTY = os.environ.get("LOG_PRETTY", "0") == "1"
+# W trybie pretty domyślnie widać wszystko (historia, postęp streamingu)
+LOG_LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "DEBUG" if LOG_PRETTY else "INFO").upper(), INFO)
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLING = _parse_sampling(os.environ.get("LOG_SAMPLING", ""))
+
+
+class _LogPipeline:
+    """Bounded event queue drained by a single writer thread."""
+    
+    def __init__(self):
+        self.level = LOG_LEVEL
+        self.pretty = LOG_PRETTY
+        self.sampling = dict(LOG_SAMPLING)
+        self.stream = sys.stdout
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def enabled(self, level: int) -> bool:
+        """Check whether events of this level are logged at all."""
+        return level >= self.level
+    
+    def emit(self, kind: str, level: int, payload: tuple):
+        """Enqueue an event (never blocks; drops when the queue is full)."""
+        if level < self.level:
+            return
+        
+        rate = self.sampling.get(kind)
+        if rate is not None and random.random() >= rate:
+            return
+        
+        if self._thread is None:
+            self.start()
+        
+        try:
+            self._queue.put_nowait((kind, level, time.time(), payload))
+        except queue.Full:
+            self.dropped += 1
+    
+    def start(self):
+        """Start the writer thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+    
+    def stop(self, timeout: float = 5.0):
+        """Flush pending events and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        
+        self._queue.put(None)
+        thread.join(timeout)
+    
+    def _run(self):
+        """Writer loop."""
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            
+            try:
+                text = self._format(*event)
+                self.stream.write(text)
+                if self._queue.empty():
+                    self.stream.flush()
+                self.written += 1
+            except Exception:
+                # Logowanie nigdy nie może zatrzymać wątku
+                pass
+    
+    def _format(self, kind: str, level: int, ts: float, payload: tuple) -> str:
+        """Format a single event according to the output mode."""
+        formatter = _PRETTY_FORMATTERS[kind] if self.pretty else _JSON_FORMATTERS[kind]
+        return formatter(level, ts, *payload)
+
+
+_pipeline = _LogPipeline()
+
+
+# --- Formatting (runs on the writer thread) ---
+
+def _timestamp(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%H:%M:%S.%f")[:-3]
+
+
+def _message_preview(msg) -> tuple:
+    """Return (type name, single-line preview) of a history message."""
+    msg_type = msg.__class__.__name__
+    content = msg.content if isinstance(getattr(msg, "content", None), str) else str(msg)
+    preview = content[:60] + "..." if len(content) > 60 else content
+    return msg_type, preview.replace('\n', ' ').replace('\r', '')
+
+
+def _json_line(level: int, ts: float, **fields) -> str:
+    record = {"ts": datetime.fromtimestamp(ts).isoformat(timespec="milliseconds"), "level": LEVEL_NAMES.get(level, level)}
+    record.update(fields)
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def _json_event(level, ts, emoji, message, data):
+    return _json_line(level, ts, event=message, emoji=emoji, data=data)
+
+
+def _json_history(level, ts, session_id, history, stats, title):
+    messages = [
+        {"type": msg_type, "preview": preview}
+        for msg_type, preview in map(_message_preview, history)
+    ]
+    return _json_line(level, ts, event="history", title=title, session_id=session_id, stats=stats, messages=messages)
+
+
+def _json_streaming(level, ts, chunk_count, total_length):
+    return _json_line(level, ts, event="streaming_progress", chunks=chunk_count, chars=total_length)
+
+
+def _json_exception(level, ts, emoji, message, error_type, error_message, trace, data):
+    return _json_line(level, ts, event=message, emoji=emoji, error_type=error_type, error=error_message, data=data, traceback=trace)
+
+
+def _json_text(level, ts, text, end):
+    return _json_line(level, ts, event="text", text=text.strip())
+
+
+def _pretty_event(level, ts, emoji, message, data):
+    lines = [f"\n{'='*80}", f"{emoji} [{_timestamp(ts)}] {message}"]
+    if data:
+        lines.append(f"{'─'*80}")
+        if isinstance(data, (dict, list)):
+            lines.append(json.dumps(data, indent=2, ensure_ascii=False, default=str))
+        else:
+            lines.append(str(data))
+    lines.append(f"{'='*80}\n")
+    return "\n".join(lines) + "\n"
+
+
+def _pretty_history(level, ts, session_id, history, stats, title):
+    lines = []
+    if title:
+        lines.extend(["\n" + "━"*80, f"📖 {title}:", "━"*80])
+    
+    lines.append(f"\n{'┌'+'─'*78+'┐'}")
+    lines.append(f"│ 📚 HISTORIA KONWERSACJI - Session: {session_id[:16]}...{' '*34}│")
+    
+    if stats:
+        lines.append(f"│ Total: {stats['total_messages']:3} | User: {stats['user_messages']:3} | AI: {stats['ai_messages']:3} | System: {stats['system_messages']:3} {' '*17}│")
+    else:
+        lines.append(f"│ Liczba wiadomości: {len(history):<56} │")
+    
+    lines.append(f"├{'─'*78}┤")
+    
+    labels = {
+        "SystemMessage": ("⚙️", "SYSTEM"),
+        "HumanMessage": ("👤", "USER  "),
+        "AIMessage": ("🤖", "AI    "),
+    }
+    for idx, msg in enumerate(history, 1):
+        msg_type, preview = _message_preview(msg)
+        icon, label = labels.get(msg_type, ("❓", "OTHER "))
+        lines.append(f"│ {idx:2}. {icon} [{label}] {preview:<58}│")
+    
+    lines.append(f"└{'─'*78}┘\n")
+    return "\n".join(lines) + "\n"
+
+
+def _pretty_streaming(level, ts, chunk_count, total_length):
+    return f"  📊 Streaming: {chunk_count} chunks | {total_length} chars\n"
+
+
+def _pretty_exception(level, ts, emoji, message, error_type, error_message, trace, data):
+    return _pretty_event(level, ts, emoji, message, data) + "📍 Stack trace:\n" + trace
+
+
+def _pretty_text(level, ts, text, end):
+    return text + end
+
 
-def log_colored(emoji: str, message: str, data=None):
+_JSON_FORMATTERS = {
+    "event": _json_event,
+    "history": _json_history,
+    "streaming": _json_streaming,
+    "exception": _json_exception,
+    "text": _json_text,
+}
+
+_PRETTY_FORMATTERS = {
+    "event": _pretty_event,
+    "history": _pretty_history,
+    "streaming": _pretty_streaming,
+    "exception": _pretty_exception,
+    "text": _pretty_text,
+}
+
+
+# --- Public API ---
+
+def configure_logging(level: str = None, pretty: bool = None, sampling: dict = None, stream=None):
+    """
+    Override logging settings taken from the environment.
+    
+    Args:
+        level: Minimum level name (DEBUG, INFO, WARNING, ERROR)
+        pretty: True for decorated console output, False for JSON lines
+        sampling: Dictionary event kind -> keep probability
+        stream: File-like object to write to (default: stdout)
+    """
+    if level is not None:
+        _pipeline.level = LEVELS[level.upper()]
+    if pretty is not None:
+        _pipeline.pretty = pretty
+    if sampling is not None:
+        _pipeline.sampling = dict(sampling)
+    if stream is not None:
+        _pipeline.stream = stream
+
+
+def start_logging():
+    """Start the background writer (called on application startup)."""
+    _pipeline.start()
+
+
+def stop_logging():
+    """Flush queued events and stop the background writer."""
+    _pipeline.stop()
+
+
+def get_logging_stats() -> dict:
+    """Get logging pipeline counters."""
+    return {
+        "queued": _pipeline._queue.qsize(),
+        "written": _pipeline.written,
+        "dropped": _pipeline.dropped,
+    }
+
+
+def log_enabled(level: int) -> bool:
+    """
+    Check whether a level is logged (to skip building expensive payloads).
+    
+    Args:
+        level: Logging level
+    """
+    return _pipeline.enabled(level)
+
+
+def log_colored(emoji: str, message: str, data=None, level: int = INFO):
     """
     Kolorowe logowanie z timestampem.
     
@@ -14,20 +306,12 @@ def log_colored(emoji: str, message: str, data=None):
         emoji: Emoji do wyświetlenia
         message: Wiadomość do zalogowania
         data: Opcjonalne dane do wyświetlenia (dict, list, lub string)
+        level: Poziom logowania
     """
-    timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    print(f"\n{'='*80}")
-    print(f"{emoji} [{timestamp}] {message}")
-    if data:
-        print(f"{'─'*80}")
-        if isinstance(data, (dict, list)):
-            print(json.dumps(data, indent=2, ensure_ascii=False))
-        else:
-            print(str(data))
-    print(f"{'='*80}\n")
+    _pipeline.emit("event", level, (emoji, message, data))
 
 
-def log_history(session_id: str, history: list, stats: dict = None):
+def log_history(session_id: str, history: list, stats: dict = None, title: str = None):
     """
     Wyświetl szczegółową historię konwersacji.
     
@@ -35,41 +319,12 @@ def log_history(session_id: str, history: list, stats: dict = None):
         session_id: ID sesji
         history: Lista wiadomości z historii
         stats: Opcjonalne statystyki (dict)
+        title: Opcjonalny nagłówek (np. "HISTORIA PRZED PRZETWORZENIEM")
     """
-    print(f"\n{'┌'+'─'*78+'┐'}")
-    print(f"│ 📚 HISTORIA KONWERSACJI - Session: {session_id[:16]}...{' '*34}│")
-    
-    if stats:
-        print(f"│ Total: {stats['total_messages']:3} | User: {stats['user_messages']:3} | AI: {stats['ai_messages']:3} | System: {stats['system_messages']:3} {' '*17}│")
-    else:
-        print(f"│ Liczba wiadomości: {len(history):<56} │")
-    
-    print(f"├{'─'*78}┤")
-    
-    for idx, msg in enumerate(history, 1):
-        msg_type = msg.__class__.__name__
-        
-        if msg_type == "SystemMessage":
-            icon = "⚙️"
-            label = "SYSTEM"
-            preview = msg.content[:60] + "..." if len(msg.content) > 60 else msg.content
-        elif msg_type == "HumanMessage":
-            icon = "👤"
-            label = "USER  "
-            preview = msg.content[:60] + "..." if len(msg.content) > 60 else msg.content
-        elif msg_type == "AIMessage":
-            icon = "🤖"
-            label = "AI    "
-            preview = msg.content[:60] + "..." if len(msg.content) > 60 else msg.content
-        else:
-            icon = "❓"
-            label = "OTHER "
-            preview = str(msg)[:60]
-        
-        preview = preview.replace('\n', ' ').replace('\r', '')
-        print(f"│ {idx:2}. {icon} [{label}] {preview:<58}│")
-    
-    print(f"└{'─'*78}┘\n")
+    if not _pipeline.enabled(DEBUG):
+        return
+    # Płytka kopia - historia może się zmienić zanim wątek ją wypisze
+    _pipeline.emit("history", DEBUG, (session_id, tuple(history), stats, title))
 
 
 def log_streaming_progress(chunk_count: int, total_length: int):
@@ -81,4 +336,32 @@ def log_streaming_progress(chunk_count: int, total_length: int):
         total_length: Całkowita długość tekstu
     """
     if chunk_count % 20 == 0:
-        print(f"  📊 Streaming: {chunk_count} chunks | {total_length} chars")
\ No newline at end of file
+        _pipeline.emit("streaming", DEBUG, (chunk_count, total_length))
+
+
+def log_exception(emoji: str, message: str, error: BaseException, data: dict = None):
+    """
+    Loguj wyjątek wraz ze stack trace.
+    
+    Args:
+        emoji: Emoji do wyświetlenia
+        message: Wiadomość do zalogowania
+        error: Złapany wyjątek
+        data: Opcjonalny kontekst (dict)
+    """
+    if not _pipeline.enabled(ERROR):
+        return
+    trace = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    _pipeline.emit("exception", ERROR, (emoji, message, type(error).__name__, str(error), trace, data))
+
+
+def log_text(text: str, level: int = DEBUG, end: str = "\n"):
+    """
+    Loguj surowy tekst (np. operacje wewnętrzne narzędzi).
+    
+    Args:
+        text: Tekst do zalogowania
+        level: Poziom logowania
+        end: Zakończenie linii w trybie pretty
+    """
+    _pipeline.emit("text", level, (text, end))
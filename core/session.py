@@ -2,30 +2,204 @@
 Session management for WebSocket connections.
 """
 
-from typing import Dict
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
 from external.model import ModelConnector
+from .logging import log_colored, log_exception
+from .session_store import SESSION_STORE_TTL, SessionStore, create_session_store
+
+# Sesja bez aktywności dłużej niż tyle sekund jest usuwana
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", "1800"))
+# Limity liczby sesji i szacowanej pamięci historii
+SESSION_MAX_COUNT = int(os.environ.get("SESSION_MAX_COUNT", "1000"))
+SESSION_MAX_MEMORY_MB = float(os.environ.get("SESSION_MAX_MEMORY_MB", "512"))
+# Co ile sekund działa sprzątanie sesji
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "60"))
+
+
+class SessionLimitError(Exception):
+    """Raised when a new session would exceed SESSION_MAX_COUNT."""
+    
+    def __init__(self, limit: int):
+        super().__init__(f"Session limit reached ({limit})")
+        self.limit = limit
+
+
+class SessionEntry:
+    """A live session: its model connector plus activity bookkeeping."""
+    
+    __slots__ = ("connector", "created_at", "last_activity", "on_evict", "owner")
+    
+    def __init__(
+        self,
+        connector: ModelConnector,
+        on_evict: Optional[Callable[[], Awaitable[None]]] = None,
+        owner: object = None
+    ):
+        now = time.monotonic()
+        self.connector = connector
+        self.created_at = now
+        self.last_activity = now
+        self.on_evict = on_evict
+        self.owner = owner
 
 
 class SessionManager:
-    """Manages user sessions for WebSocket connections."""
+    """
+    Manages user sessions for WebSocket connections.
     
-    def __init__(self):
-        self.sessions: Dict[str, ModelConnector] = {}
+    Sessions are kept in least-recently-active order. A background sweeper
+    evicts idle sessions and enforces the session count and memory caps.
     
-    def create_session(self, session_id: str) -> ModelConnector:
+    Live connectors are process-local; their state is saved to a
+    SessionStore after every turn, so a client reconnecting with the same
+    session id (to any worker, after a restart) continues the conversation.
+    """
+    
+    def __init__(
+        self,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        max_sessions: int = SESSION_MAX_COUNT,
+        max_memory_mb: float = SESSION_MAX_MEMORY_MB,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL,
+        store: Optional[SessionStore] = None
+    ):
+        self.store = store or create_session_store()
+        self.sessions: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.sweep_interval = sweep_interval
+        self.evictions = {"idle": 0, "capacity": 0, "memory": 0}
+        self.rejected = 0
+        self._sweeper: Optional[asyncio.Task] = None
+        self._closing = set()
+    
+    def create_session(
+        self,
+        session_id: str,
+        on_evict: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> ModelConnector:
         """
         Create a new session.
         
         Args:
             session_id: Unique session identifier
-            
+            on_evict: Optional async callback run when the session is evicted
+                (e.g. closing its WebSocket)
+                
         Returns:
             ModelConnector instance for this session
+            
+        Raises:
+            SessionLimitError: When SESSION_MAX_COUNT sessions are already live
         """
-        mc = ModelConnector()
-        self.sessions[session_id] = mc
+        # Przy pełnym limicie odrzuć nową sesję - nie rozłączaj trwających rozmów
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected += 1
+            raise SessionLimitError(self.max_sessions)
+        
+        mc = ModelConnector(session_id=session_id)
+        self.sessions[session_id] = SessionEntry(mc, on_evict)
         return mc
     
+    async def open_session(
+        self,
+        session_id: str,
+        owner: object = None,
+        on_evict: Optional[Callable[[], Awaitable[None]]] = None
+    ) -> tuple:
+        """
+        Attach a connection to a session, restoring saved state if any.
+        
+        A session still live in this process is taken over: the previous
+        connection is closed through its on_evict callback, which is awaited
+        so its turns have unwound before the connector is handed over.
+        
+        Args:
+            session_id: Stable session identifier sent by the client
+            owner: Connection owning the session (e.g. the WebSocket)
+            on_evict: Optional async callback run when the session is evicted
+            
+        Returns:
+            Tuple of (ModelConnector, restored) where restored is True when
+            an existing conversation was resumed
+            
+        Raises:
+            SessionLimitError: When a new session would exceed SESSION_MAX_COUNT
+        """
+        entry = self.sessions.get(session_id)
+        if entry is not None:
+            previous_on_evict = entry.on_evict
+            entry.owner = owner
+            entry.on_evict = on_evict
+            self.touch(session_id)
+            if previous_on_evict:
+                await self._run_on_evict(session_id, previous_on_evict)
+            return entry.connector, True
+        
+        state = None
+        try:
+            state = await self.store.load(session_id)
+        except Exception as e:
+            log_exception("⚠️", "BŁĄD ODCZYTU SESJI", e, {"session_id": session_id})
+        
+        mc = self.create_session(session_id, on_evict)
+        self.sessions[session_id].owner = owner
+        if state:
+            mc.restore_state(state)
+        return mc, state is not None
+    
+    async def persist_session(self, session_id: str, owner: object = None):
+        """
+        Save the session state to the store.
+        
+        Args:
+            session_id: Session identifier
+            owner: Connection saving the state; ignored if the session was taken over
+        """
+        entry = self.sessions.get(session_id)
+        if entry is None or (owner is not None and entry.owner is not owner):
+            return
+        await self._save_state(session_id, entry.connector.export_state())
+    
+    async def _save_state(self, session_id: str, state: dict):
+        """Write state to the store (a newer version saved by another worker wins)."""
+        try:
+            if not await self.store.save(session_id, state):
+                log_colored("⚠️", "POMINIĘTO NIEAKTUALNY ZAPIS SESJI", {
+                    "session_id": session_id,
+                    "version": state.get("version")
+                })
+        except Exception as e:
+            log_exception("⚠️", "BŁĄD ZAPISU SESJI", e, {"session_id": session_id})
+    
+    async def close_session(self, session_id: str, owner: object = None) -> tuple:
+        """
+        Persist and detach a session when its connection goes away.
+        
+        Args:
+            session_id: Session identifier
+            owner: Connection closing; ignored if the session was taken over
+            
+        Returns:
+            Tuple of (history, stats) if session was removed, (None, None) otherwise
+        """
+        entry = self.sessions.get(session_id)
+        # Sesję przejęło inne połączenie - jej stan zapisuje już nowy właściciel
+        if entry is None or (owner is not None and entry.owner is not owner):
+            return None, None
+        
+        # Najpierw odłącz sesję (synchronicznie), potem zapisz jej stan
+        state = entry.connector.export_state()
+        history, stats = self.delete_session(session_id)
+        await self._save_state(session_id, state)
+        return history, stats
+    
     def get_session(self, session_id: str) -> ModelConnector:
         """
         Get existing session.
@@ -36,7 +210,20 @@ class SessionManager:
         Returns:
             ModelConnector instance or None if not found
         """
-        return self.sessions.get(session_id)
+        entry = self.sessions.get(session_id)
+        return entry.connector if entry else None
+    
+    def touch(self, session_id: str):
+        """
+        Mark a session as active now.
+        
+        Args:
+            session_id: Session identifier
+        """
+        entry = self.sessions.get(session_id)
+        if entry:
+            entry.last_activity = time.monotonic()
+            self.sessions.move_to_end(session_id)
     
     def delete_session(self, session_id: str) -> tuple:
         """
@@ -48,12 +235,10 @@ class SessionManager:
         Returns:
             Tuple of (history, stats) if session existed, (None, None) otherwise
         """
-        if session_id in self.sessions:
-            session = self.sessions[session_id]
-            history = session.get_history()
-            stats = session.get_stats()
-            del self.sessions[session_id]
-            return history, stats
+        entry = self.sessions.pop(session_id, None)
+        if entry:
+            session = entry.connector
+            return session.get_history(), session.get_stats()
         return None, None
     
     def get_active_count(self) -> int:
@@ -63,6 +248,119 @@ class SessionManager:
     def get_all_stats(self) -> dict:
         """Get statistics for all active sessions."""
         return {
-            sid: session.get_stats() 
-            for sid, session in self.sessions.items()
-        }
\ No newline at end of file
+            sid: entry.connector.get_stats()
+            for sid, entry in self.sessions.items()
+        }
+    
+    def get_aggregate_stats(self) -> dict:
+        """
+        Get aggregate statistics over all active sessions.
+        
+        Returns:
+            Totals only (no per-session dump); O(sessions) with O(1) per session
+        """
+        now = time.monotonic()
+        total_messages = 0
+        memory_bytes = 0
+        for entry in self.sessions.values():
+            total_messages += len(entry.connector.history)
+            memory_bytes += entry.connector.estimated_memory_bytes()
+        
+        oldest = next(iter(self.sessions.values()), None)
+        return {
+            "active_sessions": len(self.sessions),
+            "total_messages": total_messages,
+            "estimated_memory_mb": round(memory_bytes / (1024 * 1024), 2),
+            "max_idle_seconds": round(now - oldest.last_activity, 1) if oldest else 0,
+            "evictions": dict(self.evictions),
+            "rejected": self.rejected,
+            "store": self.store.get_stats()
+        }
+    
+    # Eviction
+    
+    def _evict(self, session_id: str, reason: str):
+        """Drop a session and schedule its on_evict callback."""
+        entry = self.sessions.pop(session_id, None)
+        if entry is None:
+            return
+        
+        self.evictions[reason] += 1
+        log_colored("🧹", "USUNIĘTO SESJĘ", {
+            "session_id": session_id,
+            "reason": reason,
+            "idle_seconds": round(time.monotonic() - entry.last_activity, 1),
+            "remaining_sessions": len(self.sessions)
+        })
+        
+        if entry.on_evict:
+            task = asyncio.ensure_future(self._run_on_evict(session_id, entry.on_evict))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+    
+    async def _run_on_evict(self, session_id: str, on_evict: Callable[[], Awaitable[None]]):
+        """Run an eviction callback without letting it break the sweeper."""
+        try:
+            await asyncio.wait_for(on_evict(), timeout=5.0)
+        except Exception as e:
+            log_exception("⚠️", "BŁĄD PRZY ZAMYKANIU SESJI", e, {"session_id": session_id})
+    
+    def sweep(self) -> int:
+        """
+        Evict idle sessions and enforce the count and memory caps.
+        
+        Returns:
+            Number of evicted sessions
+        """
+        evicted = 0
+        deadline = time.monotonic() - self.idle_timeout
+        
+        # Sesje są w kolejności aktywności - najstarsze na początku
+        while self.sessions:
+            session_id, entry = next(iter(self.sessions.items()))
+            if entry.last_activity > deadline:
+                break
+            self._evict(session_id, "idle")
+            evicted += 1
+        
+        while len(self.sessions) > self.max_sessions:
+            self._evict(next(iter(self.sessions)), "capacity")
+            evicted += 1
+        
+        memory_bytes = sum(entry.connector.estimated_memory_bytes() for entry in self.sessions.values())
+        while self.sessions and memory_bytes > self.max_memory_bytes:
+            session_id, entry = next(iter(self.sessions.items()))
+            memory_bytes -= entry.connector.estimated_memory_bytes()
+            self._evict(session_id, "memory")
+            evicted += 1
+        
+        return evicted
+    
+    async def _sweep_loop(self):
+        """Background loop running sweep() periodically."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+                await self.store.purge(SESSION_STORE_TTL)
+            except Exception as e:
+                log_exception("💥", "BŁĄD SPRZĄTANIA SESJI", e)
+    
+    async def start_sweeper(self):
+        """Start the background sweeper (called on application startup)."""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+    
+    async def stop_sweeper(self):
+        """Stop the background sweeper and save live sessions."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        
+        for session_id in list(self.sessions):
+            await self.persist_session(session_id)
+        await self.store.close()
@@ -0,0 +1,235 @@
+"""
+Pluggable storage for serialized session state.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+# Backend: "sqlite" (współdzielony przez workery, przeżywa restart) lub "memory"
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite").lower()
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "sessions.db")
+# Po tylu sekundach bez zapisu stan sesji jest usuwany ze store'u
+SESSION_STORE_TTL = float(os.environ.get("SESSION_STORE_TTL", str(7 * 24 * 3600)))
+
+
+class SessionStore(ABC):
+    """Persists session state (as produced by ModelConnector.export_state)."""
+    
+    def __init__(self):
+        self.loads = 0
+        self.saves = 0
+        self.misses = 0
+        self.stale_saves = 0
+    
+    @abstractmethod
+    async def load(self, session_id: str) -> Optional[dict]:
+        """
+        Load saved state.
+        
+        Args:
+            session_id: Session identifier
+            
+        Returns:
+            Saved state or None if the session is unknown
+        """
+    
+    @abstractmethod
+    async def save(self, session_id: str, state: dict) -> bool:
+        """
+        Save (replace) the state of a session unless a newer one is stored.
+        
+        The write is a compare-and-set on state["version"]: a worker that
+        noticed its disconnect late cannot overwrite turns another worker
+        has already saved.
+        
+        Args:
+            session_id: Session identifier
+            state: JSON-serializable state with an integer "version"
+            
+        Returns:
+            True if written, False if the stored state has a newer version
+        """
+    
+    @abstractmethod
+    async def delete(self, session_id: str):
+        """
+        Forget a session.
+        
+        Args:
+            session_id: Session identifier
+        """
+    
+    @abstractmethod
+    async def purge(self, max_age: float) -> int:
+        """
+        Drop sessions not saved for max_age seconds.
+        
+        Returns:
+            Number of removed sessions
+        """
+    
+    async def close(self):
+        """Release resources (called on application shutdown)."""
+    
+    def get_stats(self) -> dict:
+        """Get store counters."""
+        return {
+            "backend": self.backend,
+            "loads": self.loads,
+            "saves": self.saves,
+            "misses": self.misses,
+            "stale_saves": self.stale_saves,
+        }
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store (state is lost on restart and not shared by workers)."""
+    
+    backend = "memory"
+    
+    def __init__(self):
+        super().__init__()
+        self._states: Dict[str, Tuple[float, dict]] = {}
+    
+    async def load(self, session_id: str) -> Optional[dict]:
+        entry = self._states.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.loads += 1
+        return entry[1]
+    
+    async def save(self, session_id: str, state: dict) -> bool:
+        stored = self._states.get(session_id)
+        if stored is not None and stored[1].get("version", 0) > state.get("version", 0):
+            self.stale_saves += 1
+            return False
+        self._states[session_id] = (time.time(), state)
+        self.saves += 1
+        return True
+    
+    async def delete(self, session_id: str):
+        self._states.pop(session_id, None)
+    
+    async def purge(self, max_age: float) -> int:
+        deadline = time.time() - max_age
+        expired = [sid for sid, (saved_at, _) in self._states.items() if saved_at < deadline]
+        for sid in expired:
+            del self._states[sid]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    File-backed store shared by all workers on one host.
+    
+    Uses WAL mode so readers never block the writer; blocking sqlite calls
+    run in a worker thread to keep the event loop free.
+    """
+    
+    backend = "sqlite"
+    
+    def __init__(self, path: str = SESSION_STORE_PATH):
+        """
+        Initialize the store (the database is opened on first use).
+        
+        Args:
+            path: SQLite database file
+        """
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open (and create if needed) the database."""
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Bazy utworzone przed dodaniem wersji stanu
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at)")
+        conn.commit()
+        return conn
+    
+    def _execute(self, sql: str, params: tuple = (), fetch: bool = False):
+        """Run one statement under the connection lock (in a worker thread)."""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            cursor = self._conn.execute(sql, params)
+            if fetch:
+                return cursor.fetchone()
+            self._conn.commit()
+            return cursor.rowcount
+    
+    async def load(self, session_id: str) -> Optional[dict]:
+        row = await asyncio.to_thread(
+            self._execute, "SELECT state FROM sessions WHERE session_id = ?", (session_id,), True
+        )
+        if row is None:
+            self.misses += 1
+            return None
+        self.loads += 1
+        return json.loads(row[0])
+    
+    async def save(self, session_id: str, state: dict) -> bool:
+        written = await asyncio.to_thread(self._save, session_id, state)
+        if not written:
+            self.stale_saves += 1
+            return False
+        self.saves += 1
+        return True
+    
+    def _save(self, session_id: str, state: dict) -> bool:
+        # Porównanie wersji i zapis w jednej instrukcji - atomowo względem innych workerów
+        return self._execute(
+            "INSERT INTO sessions (session_id, state, updated_at, version) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, "
+            "version = excluded.version WHERE excluded.version >= sessions.version",
+            (session_id, json.dumps(state, ensure_ascii=False), time.time(), state.get("version", 0))
+        ) > 0
+    
+    async def delete(self, session_id: str):
+        await asyncio.to_thread(self._execute, "DELETE FROM sessions WHERE session_id = ?", (session_id,))
+    
+    async def purge(self, max_age: float) -> int:
+        return await asyncio.to_thread(
+            self._execute, "DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,)
+        )
+    
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_session_store(backend: str = SESSION_STORE) -> SessionStore:
+    """
+    Create the session store selected by SESSION_STORE.
+    
+    Args:
+        backend: "sqlite" or "memory"
+        
+    Returns:
+        SessionStore instance
+    """
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
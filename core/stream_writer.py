@@ -0,0 +1,137 @@
+"""
+Coalescing writer for stream_chunk WebSocket messages.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Optional
+
+# Okno sklejania chunków w ms (0 = każdy chunk to osobna ramka)
+WS_COALESCE_MS = float(os.environ.get("WS_COALESCE_MS", "30"))
+# Po tylu bajtach bufor jest wysyłany od razu, bez czekania na okno
+WS_COALESCE_BYTES = int(os.environ.get("WS_COALESCE_BYTES", "512"))
+
+_stats = {"messages": 0, "chunks": 0, "frames": 0, "bytes": 0}
+
+
+class CoalescingStreamWriter:
+    """
+    Batches streamed chunks of one response into fewer stream_chunk frames.
+    
+    The first chunk of a response is sent immediately, so coalescing never
+    delays the time to first chunk. After that, the first buffered chunk
+    opens a time window; the buffer is sent when the window closes or when
+    it reaches the size threshold, whichever comes first. Frames keep the
+    {"type": "stream_chunk", "content": ...} shape, so clients only see
+    fewer, larger chunks.
+    """
+    
+    def __init__(
+        self,
+        send_json: Callable[[dict], Awaitable[None]],
+        window_ms: float = WS_COALESCE_MS,
+        max_bytes: int = WS_COALESCE_BYTES
+    ):
+        """
+        Initialize the writer.
+        
+        Args:
+            send_json: Coroutine function sending one JSON message (websocket.send_json)
+            window_ms: Coalescing window in milliseconds (0 disables batching)
+            max_bytes: Buffer size (UTF-8) that triggers an immediate flush
+        """
+        self._send_json = send_json
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._buffer: List[str] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._closed = False
+        self.chunks = 0
+        self.frames = 0
+        self.bytes = 0
+        _stats["messages"] += 1
+    
+    async def write(self, chunk: str):
+        """
+        Queue a chunk for the client.
+        
+        Args:
+            chunk: Visible response text
+        """
+        if not chunk or self._closed:
+            return
+        
+        self._buffer.append(chunk)
+        self._size += len(chunk.encode("utf-8"))
+        self.chunks += 1
+        _stats["chunks"] += 1
+        
+        # Pierwsza ramka odpowiedzi idzie od razu - sklejamy dopiero kolejne
+        if self.window <= 0 or self.frames == 0 or self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+    
+    async def flush(self):
+        """Send everything buffered so far as one frame."""
+        self._cancel_timer()
+        async with self._lock:
+            if not self._buffer:
+                return
+            content = "".join(self._buffer)
+            size = self._size
+            self._buffer.clear()
+            self._size = 0
+            
+            await self._send_json({
+                "type": "stream_chunk",
+                "content": content
+            })
+            self.frames += 1
+            self.bytes += size
+            _stats["frames"] += 1
+            _stats["bytes"] += size
+    
+    async def close(self):
+        """Flush the remaining text (call before sending stream_end)."""
+        self._closed = True
+        self._cancel_timer()
+        await self.flush()
+    
+    def discard(self):
+        """Drop buffered text and stop the timer (the response was aborted)."""
+        self._closed = True
+        self._cancel_timer()
+        self._buffer.clear()
+        self._size = 0
+    
+    async def _flush_later(self):
+        """Flush when the coalescing window closes."""
+        await asyncio.sleep(self.window)
+        # Po close()/discard() nic już nie wysyłamy - stream_end mógł zostać wysłany
+        if self._closed:
+            return
+        # Od tej chwili timer nie jest anulowany - nie przerywamy wysyłania ramki
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            # Zerwane połączenie wyjdzie przy kolejnym zapisie lub stream_end
+            pass
+    
+    def _cancel_timer(self):
+        timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+
+def get_stream_stats() -> dict:
+    """Get coalescing counters with frames per message and bytes per frame."""
+    stats = dict(_stats, window_ms=WS_COALESCE_MS, max_bytes=WS_COALESCE_BYTES)
+    messages, frames = stats["messages"], stats["frames"]
+    stats["frames_per_message"] = round(frames / messages, 2) if messages else 0.0
+    stats["bytes_per_frame"] = round(stats["bytes"] / frames, 1) if frames else 0.0
+    stats["chunks_per_frame"] = round(stats["chunks"] / frames, 2) if frames else 0.0
+    return stats
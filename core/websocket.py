@@ -2,19 +2,51 @@
 WebSocket connection handler for Play virtual consultant.
 """
 
+import os
+import uuid
+import asyncio
+from typing import Optional, Set
+
 from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 from datetime import datetime
-import traceback
 
-from .logging import log_colored, log_history, log_streaming_progress
-from .session import SessionManager
+from .logging import (
+    DEBUG, WARNING, log_colored, log_enabled, log_exception, log_history,
+    log_streaming_progress, log_text
+)
+from .session import SessionLimitError, SessionManager
+from .stream_writer import CoalescingStreamWriter, get_stream_stats
+from external.scheduler import SchedulerBusyError
+
+# Nowa wiadomość przerywa trwającą odpowiedź zamiast czekać na jej koniec
+WS_SUPERSEDE_ON_NEW_MESSAGE = os.environ.get("WS_SUPERSEDE_ON_NEW_MESSAGE", "0") == "1"
+# Limit tur na połączenie (trwająca + oczekujące) - kolejne wiadomości są odrzucane
+WS_MAX_PENDING_TURNS = int(os.environ.get("WS_MAX_PENDING_TURNS", "2"))
 
 
 class WebSocketHandler:
-    """Handles WebSocket connections and message processing."""
+    """
+    Handles WebSocket connections and message processing.
     
-    def __init__(self, session_manager: SessionManager):
+    Each user turn runs as its own task while the socket keeps being read,
+    so a disconnect cancels the turn (LLM stream and pending tools). With
+    WS_SUPERSEDE_ON_NEW_MESSAGE=1 a new message cancels the running turn;
+    otherwise turns are processed one after another, at most
+    WS_MAX_PENDING_TURNS per connection (messages beyond that are rejected).
+    """
+    
+    def __init__(
+        self,
+        session_manager: SessionManager,
+        supersede: bool = WS_SUPERSEDE_ON_NEW_MESSAGE,
+        max_pending_turns: int = WS_MAX_PENDING_TURNS
+    ):
         self.session_manager = session_manager
+        self.supersede = supersede
+        self.max_pending_turns = max(1, max_pending_turns)
+        self.cancellations = {"disconnect": 0, "superseded": 0, "evicted": 0}
+        self.dropped_messages = 0
     
     async def handle_connection(self, websocket: WebSocket):
         """
@@ -25,29 +57,62 @@ class WebSocketHandler:
         """
         await websocket.accept()
         
-        # Create unique session
-        session_id = str(id(websocket))
-        mc = self.session_manager.create_session(session_id)
+        # Stable session id - the client reconnects with ?session_id=...
+        session_id = self._session_id_from(websocket)
+        # Tury tego połączenia (przerywane także przy przejęciu lub usunięciu sesji)
+        turns: Set[asyncio.Task] = set()
+        try:
+            mc, restored = await self.session_manager.open_session(
+                session_id,
+                owner=websocket,
+                on_evict=lambda: self._close_evicted(websocket, session_id, turns)
+            )
+        except SessionLimitError as limit:
+            log_colored("🚦", "LIMIT SESJI - ODRZUCONO POŁĄCZENIE", {
+                "session_id": session_id,
+                "limit": limit.limit
+            }, level=WARNING)
+            # 1013 = "Try Again Later"
+            await websocket.close(code=1013, reason="Too many sessions, try again later")
+            return
         
         log_colored("🟢", "NOWE POŁĄCZENIE", {
             "session_id": session_id,
+            "restored": restored,
             "client": str(websocket.client),
             "total_sessions": self.session_manager.get_active_count()
         })
         
+        await websocket.send_json({
+            "type": "session",
+            "session_id": session_id,
+            "restored": restored
+        })
+        
         # Send welcome message
         await self._send_welcome(websocket, session_id, mc)
         
         try:
             # Main message loop
-            await self._message_loop(websocket, session_id, mc)
+            await self._message_loop(websocket, session_id, mc, turns)
             
         except WebSocketDisconnect:
-            await self._handle_disconnect(session_id)
+            await self._handle_disconnect(websocket, session_id)
             
         except Exception as e:
             await self._handle_error(websocket, session_id, e)
     
+    @staticmethod
+    def _session_id_from(websocket: WebSocket) -> str:
+        """Take a valid session id from the query string or generate a new one."""
+        requested = websocket.query_params.get("session_id")
+        if requested:
+            try:
+                return str(uuid.UUID(requested))
+            except ValueError:
+                pass
+        return str(uuid.uuid4())
+    
     async def _send_welcome(self, websocket: WebSocket, session_id: str, mc):
         """Send welcome message to client."""
         welcome_msg = "Cześć! Jestem doradcą w Play. W czym mogę Ci dziś pomóc? 😊"
@@ -62,36 +127,139 @@ class WebSocketHandler:
             "message": welcome_msg
         })
         
-        log_history(session_id, mc.get_history(), mc.get_stats())
-    
-    async def _message_loop(self, websocket: WebSocket, session_id: str, mc):
-        """Main message processing loop."""
-        while True:
-            # Receive message
-            message = await websocket.receive_text()
-            
-            if not message.strip():
-                log_colored("⚠️", "OTRZYMANO PUSTĄ WIADOMOŚĆ", {"session_id": session_id})
-                continue
-            
-            log_colored("📨", "OTRZYMANO WIADOMOŚĆ OD UŻYTKOWNIKA", {
-                "session_id": session_id,
-                "message": message,
-                "length": len(message)
-            })
-            
-            # Log history before processing
-            print("\n" + "━"*80)
-            print("📖 HISTORIA PRZED PRZETWORZENIEM:")
-            print("━"*80)
+        if log_enabled(DEBUG):
             log_history(session_id, mc.get_history(), mc.get_stats())
-            
-            try:
-                # Process message with streaming
-                await self._process_message(websocket, session_id, mc, message)
+    
+    async def _message_loop(self, websocket: WebSocket, session_id: str, mc, turns: Set[asyncio.Task]):
+        """Main message processing loop (reads the socket while turns run)."""
+        previous: Optional[asyncio.Task] = None
+        
+        try:
+            while True:
+                # Receive message
+                message = await websocket.receive_text()
+                self.session_manager.touch(session_id)
+                
+                if not message.strip():
+                    log_colored("⚠️", "OTRZYMANO PUSTĄ WIADOMOŚĆ", {"session_id": session_id})
+                    continue
+                
+                log_colored("📨", "OTRZYMANO WIADOMOŚĆ OD UŻYTKOWNIKA", {
+                    "session_id": session_id,
+                    "message": message,
+                    "length": len(message)
+                })
                 
-            except Exception as api_error:
+                if self.supersede and turns:
+                    await self._cancel_turns(turns, session_id, "superseded")
+                    previous = None
+                elif len(turns) >= self.max_pending_turns:
+                    # Odczyt gniazda nie blokuje się na turach - bez limitu kolejka rosłaby bez końca
+                    await self._reject_message(websocket, session_id, len(turns))
+                    continue
+                
+                turn = asyncio.create_task(self._run_turn(websocket, session_id, mc, message, previous))
+                turns.add(turn)
+                turn.add_done_callback(turns.discard)
+                previous = turn
+        finally:
+            # Rozłączenie (lub błąd) - nie generuj odpowiedzi, której nikt nie odbierze
+            if turns:
+                await self._cancel_turns(turns, session_id, "disconnect")
+    
+    async def _run_turn(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        mc,
+        message: str,
+        previous: Optional[asyncio.Task] = None
+    ):
+        """Run a single user turn (after the previous one has finished)."""
+        if previous is not None:
+            await asyncio.wait({previous})
+        
+        # Log history before processing
+        if log_enabled(DEBUG):
+            log_history(session_id, mc.get_history(), mc.get_stats(), title="HISTORIA PRZED PRZETWORZENIEM")
+        
+        try:
+            # Process message with streaming
+            await self._process_message(websocket, session_id, mc, message)
+        
+        except asyncio.CancelledError:
+            # Zamknij rozpoczętą odpowiedź po stronie klienta, jeśli nadal słucha
+            if websocket.client_state == WebSocketState.CONNECTED:
+                try:
+                    await websocket.send_json({
+                        "type": "stream_end",
+                        "content": ""
+                    })
+                except Exception:
+                    pass
+            raise
+        
+        except SchedulerBusyError as busy:
+            try:
+                await self._handle_busy(websocket, session_id, busy)
+            except Exception as e:
+                log_exception("💥", "NIE UDAŁO SIĘ WYSŁAĆ BŁĘDU", e, {"session_id": session_id})
+        
+        except Exception as api_error:
+            try:
                 await self._handle_api_error(websocket, session_id, message, api_error)
+            except Exception as e:
+                log_exception("💥", "NIE UDAŁO SIĘ WYSŁAĆ BŁĘDU", e, {"session_id": session_id})
+        
+        await self.session_manager.persist_session(session_id, owner=websocket)
+    
+    async def _cancel_turns(self, turns: Set[asyncio.Task], session_id: str, reason: str):
+        """
+        Cancel running and queued turns and wait until they unwind.
+        
+        Args:
+            turns: Turn tasks of the session
+            session_id: Session identifier
+            reason: "disconnect", "superseded" or "evicted"
+        """
+        pending = [turn for turn in turns if not turn.done()]
+        if not pending:
+            return
+        
+        for turn in pending:
+            turn.cancel()
+        await asyncio.wait(pending)
+        
+        self.cancellations[reason] += len(pending)
+        log_colored("🛑", "PRZERWANO TURĘ", {
+            "session_id": session_id,
+            "reason": reason,
+            "turns": len(pending)
+        })
+    
+    async def _reject_message(self, websocket: WebSocket, session_id: str, pending: int):
+        """Tell the client a message was dropped because too many turns are pending."""
+        self.dropped_messages += 1
+        log_colored("🚦", "ZA DUŻO WIADOMOŚCI - ODRZUCONO", {
+            "session_id": session_id,
+            "pending_turns": pending
+        }, level=WARNING)
+        
+        await websocket.send_json({
+            "type": "error",
+            "code": "too_many_messages",
+            "content": "⏳ Poczekaj, aż odpowiem na poprzednie wiadomości, i wyślij tę ponownie."
+        })
+    
+    def get_stats(self) -> dict:
+        """Get handler counters (cancelled turns by reason, dropped messages)."""
+        return {
+            "supersede": self.supersede,
+            "max_pending_turns": self.max_pending_turns,
+            "dropped_messages": self.dropped_messages,
+            "cancelled_turns": dict(self.cancellations),
+            "stream": get_stream_stats()
+        }
     
     async def _process_message(self, websocket: WebSocket, session_id: str, mc, message: str):
         """Process user message with AI model."""
@@ -106,15 +274,13 @@ class WebSocketHandler:
         total_length = 0
         chunks_preview = []
         client_message_started = False
+        # Drobne chunki sklejane w większe ramki stream_chunk
+        writer = CoalescingStreamWriter(websocket.send_json)
         
         async def stream_to_client(chunk: str):
-            """Stream chunks to the client."""
+            """Stream chunks to the client (tool markers are already filtered out)."""
             nonlocal chunk_count, total_length, chunks_preview, client_message_started
             
-            # Skip tool command text from being sent to client
-            if chunk.startswith("[") and ("CHECK_CUSTOMER" in chunk or "GET_CATALOG" in chunk or "CREATE_ORDER" in chunk or "CHECK_INVOICES" in chunk):
-                return
-            
             chunk_count += 1
             total_length += len(chunk)
             
@@ -122,11 +288,8 @@ class WebSocketHandler:
             if chunk_count <= 5:
                 chunks_preview.append(chunk)
             
-            # Send chunk to client
-            await websocket.send_json({
-                "type": "stream_chunk",
-                "content": chunk
-            })
+            # Send chunk to client (coalesced)
+            await writer.write(chunk)
             client_message_started = True
             
             # Log progress every 20 chunks
@@ -138,22 +301,27 @@ class WebSocketHandler:
         async def log_internal(message: str):
             """Log internal operations (tool execution, etc)."""
             internal_logs.append(message)
-            print(f"  🔧 {message}", end='', flush=True)
+            log_text(f"  🔧 {message}", end='')
         
         log_colored("⚙️", "ROZPOCZYNAM PRZETWARZANIE", {
             "session_id": session_id,
             "model": "gpt-oss-120b (Scaleway)",
+            "tool_calling": mc.tool_calling_mode,
             "streaming": True,
             "user_message": message
         })
         
         # Process with model
         start_time = datetime.now()
-        response = await mc.get_model_response(
-            message, 
-            stream_callback=stream_to_client,
-            internal_callback=log_internal
-        )
+        try:
+            response = await mc.get_model_response(
+                message, 
+                stream_callback=stream_to_client,
+                internal_callback=log_internal
+            )
+            await writer.close()
+        finally:
+            writer.discard()
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         
@@ -166,26 +334,28 @@ class WebSocketHandler:
         log_colored("✅", "ZAKOŃCZONO PRZETWARZANIE", {
             "session_id": session_id,
             "chunks_sent_to_client": chunk_count,
+            "frames_sent_to_client": writer.frames,
             "total_client_length": total_length,
             "duration_seconds": round(duration, 2),
             "chars_per_second": round(total_length / duration, 2) if duration > 0 else 0,
             "internal_operations": len(internal_logs),
+            "usage": dict(mc.last_turn_usage),
+            "timing": mc.last_turn_timing,
             "first_chunks": "".join(chunks_preview[:3])
         })
         
         # Log internal operations
-        if internal_logs:
-            print("\n" + "─"*80)
-            print("🔧 OPERACJE WEWNĘTRZNE (nie widoczne dla klienta):")
-            for log in internal_logs:
-                print(f"  • {log.strip()}")
-            print("─"*80)
+        if internal_logs and log_enabled(DEBUG):
+            log_text("\n".join([
+                "\n" + "─"*80,
+                "🔧 OPERACJE WEWNĘTRZNE (nie widoczne dla klienta):",
+                *(f"  • {log.strip()}" for log in internal_logs),
+                "─"*80
+            ]))
         
         # Log history after processing
-        print("\n" + "━"*80)
-        print("📖 HISTORIA PO PRZETWORZENIU:")
-        print("━"*80)
-        log_history(session_id, mc.get_history(), mc.get_stats())
+        if log_enabled(DEBUG):
+            log_history(session_id, mc.get_history(), mc.get_stats(), title="HISTORIA PO PRZETWORZENIU")
         
         # Log full AI response
         log_colored("🤖", "ODPOWIEDŹ AI (pełna - klient widzi tylko końcówkę)", {
@@ -193,12 +363,12 @@ class WebSocketHandler:
             "response_preview": response[:300] + "..." if len(response) > 300 else response,
             "full_length": len(response),
             "client_visible_length": total_length,
-            "has_tool_commands": any(cmd in response for cmd in ["[CHECK_CUSTOMER:", "[GET_CATALOG:", "[CREATE_ORDER:", "[CHECK_INVOICES:"])
+            "tool_commands": list(mc.last_turn_tools)
         })
     
     async def _handle_api_error(self, websocket: WebSocket, session_id: str, message: str, error: Exception):
         """Handle API errors during message processing."""
-        log_colored("❌", "BŁĄD API", {
+        log_exception("❌", "BŁĄD API", error, {
             "session_id": session_id,
             "error_type": type(error).__name__,
             "error_message": str(error),
@@ -211,13 +381,34 @@ class WebSocketHandler:
             "type": "error",
             "content": error_message
         })
+    
+    async def _handle_busy(self, websocket: WebSocket, session_id: str, error: SchedulerBusyError):
+        """Tell the client the model is overloaded (the turn was not started)."""
+        log_colored("🚦", "MODEL PRZECIĄŻONY - ODRZUCONO TURĘ", {
+            "session_id": session_id,
+            "reason": error.reason
+        }, level=WARNING)
+        
+        await websocket.send_json({
+            "type": "error",
+            "code": "busy",
+            "content": "⏳ Mamy teraz bardzo dużo rozmów. Spróbuj ponownie za kilka sekund."
+        })
+    
+    async def _close_evicted(self, websocket: WebSocket, session_id: str, turns: Set[asyncio.Task]):
+        """
+        Close the socket of a session evicted or taken over by another connection.
         
-        print("📍 Stack trace:")
-        traceback.print_exc()
+        Returns only after the connection's turns have unwound, so they can no
+        longer touch (or roll back) the shared history.
+        """
+        await self._cancel_turns(turns, session_id, "evicted")
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close(code=1001, reason="Session expired")
     
-    async def _handle_disconnect(self, session_id: str):
+    async def _handle_disconnect(self, websocket: WebSocket, session_id: str):
         """Handle client disconnect."""
-        final_history, final_stats = self.session_manager.delete_session(session_id)
+        final_history, final_stats = await self.session_manager.close_session(session_id, owner=websocket)
         
         if final_history:
             log_colored("🔴", "ROZŁĄCZONO KLIENTA", {
@@ -226,20 +417,14 @@ class WebSocketHandler:
                 "remaining_sessions": self.session_manager.get_active_count()
             })
             
-            print("\n" + "━"*80)
-            print("📖 OSTATECZNA HISTORIA PRZED ROZŁĄCZENIEM:")
-            print("━"*80)
-            log_history(session_id, final_history, final_stats)
+            log_history(session_id, final_history, final_stats, title="OSTATECZNA HISTORIA PRZED ROZŁĄCZENIEM")
     
     async def _handle_error(self, websocket: WebSocket, session_id: str, error: Exception):
         """Handle unexpected errors."""
-        log_colored("💥", "NIEOCZEKIWANY BŁĄD", {
+        log_exception("💥", "NIEOCZEKIWANY BŁĄD", error, {
             "session_id": session_id,
             "error_type": type(error).__name__,
             "error_message": str(error)
         })
         
-        self.session_manager.delete_session(session_id)
-        
-        print("📍 Stack trace:")
-        traceback.print_exc()
\ No newline at end of file
+        await self.session_manager.close_session(session_id, owner=websocket)
\ No newline at end of file
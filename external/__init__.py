@@ -3,15 +3,24 @@ External integrations package for Play virtual consultant.
 """
 
 from .model import ModelConnector
+from .llm import get_llm, close_llm
+from .scheduler import LLMScheduler, SchedulerBusyError, llm_scheduler
 from .prompts import SYSTEM_PROMPT, TOOL_PROCESSING_PROMPT
 from .tool_executor import ToolExecutor
+from .stream_filter import ToolMarkerFilter
 from .mcp_server import check_customer, get_product_catalog, create_order, check_invoices, check_invoices_by_pesel
 
 __all__ = [
     'ModelConnector',
+    'get_llm',
+    'close_llm',
+    'LLMScheduler',
+    'SchedulerBusyError',
+    'llm_scheduler',
     'SYSTEM_PROMPT',
     'TOOL_PROCESSING_PROMPT',
     'ToolExecutor',
+    'ToolMarkerFilter',
     'check_customer',
     'get_product_catalog',
     'create_order',
@@ -0,0 +1,138 @@
+"""
+Process-wide cache of answers to generic (FAQ-style) first messages.
+"""
+
+import os
+import re
+from typing import List, Optional
+
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+from .cache import LRUTTLCache
+from .mcp_server import catalog_version
+from .prefetch import normalize_command
+from .prompts import SYSTEM_PROMPT_HASH
+
+# Cache odpowiedzi jest opcjonalny (ANSWER_CACHE=1 włącza)
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "900"))
+
+# Narzędzia, których wynik nie zależy od klienta
+CACHEABLE_TOOLS = ("GET_CATALOG",)
+
+# Dłuższe ciągi cyfr to PESEL, ID klienta, numery faktur - takie tury nie są ogólne
+PERSONAL_NUMBER_PATTERN = re.compile(r"\d{5,}")
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """
+    Normalize a user message for cache lookups.
+    
+    Args:
+        text: User message
+        
+    Returns:
+        Lowercase text without punctuation and with single spaces
+    """
+    text = _NON_WORD.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class CachedAnswer:
+    """A finished turn: client chunks and the history messages it added."""
+    
+    __slots__ = ("text", "chunks", "messages")
+    
+    def __init__(self, text: str, chunks: List[str], messages: List[dict]):
+        self.text = text
+        self.chunks = chunks
+        self.messages = messages
+
+
+class AnswerCache:
+    """
+    LRU/TTL cache of whole turns for messages without customer context.
+    
+    The key combines the normalized question with the tool calling mode,
+    the catalog version and the system prompt hash, so a catalog or prompt
+    change never serves an outdated answer. Only turns whose tools are all
+    customer-independent are stored.
+    """
+    
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        """
+        Initialize the cache.
+        
+        Args:
+            maxsize: Maximum number of cached answers
+            ttl: Seconds an answer may be served
+        """
+        self._cache = LRUTTLCache(maxsize, ttl)
+        self.stores = 0
+        self.rejected = 0
+    
+    @staticmethod
+    def is_generic(text: str) -> bool:
+        """Check that a message carries no personal identifiers."""
+        return not PERSONAL_NUMBER_PATTERN.search(text) and bool(normalize_question(text))
+    
+    @staticmethod
+    def key(text: str, tool_calling_mode: str) -> tuple:
+        """
+        Build the cache key of a question.
+        
+        Args:
+            text: User message
+            tool_calling_mode: "markers" or "native" (history shapes differ)
+            
+        Returns:
+            Hashable key
+        """
+        return (normalize_question(text), tool_calling_mode, catalog_version(), SYSTEM_PROMPT_HASH)
+    
+    def get(self, key: tuple) -> Optional[CachedAnswer]:
+        """
+        Get a cached answer.
+        
+        Args:
+            key: Key built with key()
+            
+        Returns:
+            CachedAnswer or None
+        """
+        return self._cache.get(key)
+    
+    def put(self, key: tuple, text: str, chunks: List[str], messages: List[BaseMessage], commands: List[str]):
+        """
+        Store a finished turn if it only used customer-independent tools.
+        
+        Args:
+            key: Key built with key() after the turn
+            text: Final answer
+            chunks: Chunks streamed to the client
+            messages: History messages added after the user message
+            commands: Tool commands executed in the turn
+        """
+        if not text or any(not normalize_command(cmd)[1:].startswith(CACHEABLE_TOOLS) for cmd in commands):
+            self.rejected += 1
+            return
+        self._cache.set(key, CachedAnswer(text, list(chunks), messages_to_dict(messages)))
+        self.stores += 1
+    
+    @staticmethod
+    def messages(answer: CachedAnswer) -> List[BaseMessage]:
+        """Fresh copies of the history messages of a cached answer."""
+        return messages_from_dict(answer.messages)
+    
+    def get_stats(self) -> dict:
+        """Get cache counters."""
+        stats = self._cache.get_stats()
+        stats.update(enabled=ANSWER_CACHE, stores=self.stores, rejected=self.rejected)
+        return stats
+
+
+answer_cache = AnswerCache()
+
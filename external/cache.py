@@ -0,0 +1,259 @@
+"""
+In-process caching primitives used by the MCP tools.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight call.
+    
+    The first caller starts the work, everybody else arriving before it
+    finishes awaits the very same result (or exception).
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+    
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run loader once per key at a time.
+        
+        Args:
+            key: Identity of the call (calls with equal keys are shared)
+            loader: Zero-argument coroutine function doing the actual work
+            
+        Returns:
+            Result of the (possibly shared) loader call
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        
+        # shield: a cancelled caller must not cancel the work shared with others
+        return await asyncio.shield(task)
+    
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        """Drop a finished call and mark its exception as retrieved."""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+
+class StaleWhileRevalidateCache:
+    """
+    TTL cache that keeps serving stale values while refreshing them.
+    
+    Fresh entries (younger than ttl) are returned directly. Stale entries
+    (younger than ttl + stale_ttl) are returned immediately and a single
+    background refresh is started. Misses are loaded through SingleFlight,
+    so a burst of identical requests results in one loader call.
+    """
+    
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        should_cache: Optional[Callable[[Any], bool]] = None
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            ttl: Seconds an entry is considered fresh
+            stale_ttl: Extra seconds a stale entry may still be served
+            should_cache: Optional predicate rejecting values (e.g. errors)
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._should_cache = should_cache or (lambda value: True)
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._flight = SingleFlight()
+        self._refreshing: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+    
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get a value, loading or refreshing it when needed.
+        
+        Args:
+            key: Cache key
+            loader: Zero-argument coroutine function producing the value
+            
+        Returns:
+            Cached or freshly loaded value
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.hits += 1
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader)
+                return entry[1]
+        
+        self.misses += 1
+        return await self._flight.do(key, lambda: self._load(key, loader))
+    
+    def keys(self) -> List[Hashable]:
+        """Keys of all cached entries (fresh or stale)."""
+        return list(self._entries)
+    
+    def peek(self, key: Hashable) -> Any:
+        """Return the cached value for key (fresh or stale) without loading."""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+    
+    def invalidate(self, key: Hashable = None):
+        """
+        Drop one entry, or everything when key is None.
+        
+        Args:
+            key: Cache key to drop
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+    
+    def get_stats(self) -> dict:
+        """Get cache counters."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+            "refreshing": len(self._refreshing),
+        }
+    
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Call the loader and store its value if it is cacheable."""
+        value = await loader()
+        if self._should_cache(value):
+            self._entries[key] = (time.monotonic(), value)
+        return value
+    
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        """Start one background refresh per key; the stale value stays on failure."""
+        if key in self._flight:
+            return
+        
+        async def refresh():
+            try:
+                await self._flight.do(key, lambda: self._load(key, loader))
+            except Exception:
+                pass
+        
+        task = asyncio.create_task(refresh())
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshing.discard)
+
+
+class LRUTTLCache:
+    """
+    Small bounded LRU cache whose entries expire after a fixed TTL.
+    
+    Every invalidation bumps `generation`; a value loaded before an
+    invalidation can be stored conditionally so it never resurrects
+    state that was invalidated while it was in flight.
+    """
+    
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        Initialize the cache.
+        
+        Args:
+            maxsize: Maximum number of entries (least recently used go first)
+            ttl: Seconds after which an entry expires
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Any:
+        """
+        Get a live entry.
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            Cached value or None when missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Store a value.
+        
+        Args:
+            key: Cache key
+            value: Value to store
+            generation: If given, store only when no invalidation happened since
+        """
+        if self.maxsize <= 0 or (generation is not None and generation != self.generation):
+            return
+        
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        """
+        Drop a single entry.
+        
+        Args:
+            key: Cache key
+        """
+        self.generation += 1
+        self._entries.pop(key, None)
+    
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]):
+        """
+        Drop every entry matching a predicate.
+        
+        Args:
+            predicate: Called with (key, value), True means drop
+        """
+        self.generation += 1
+        for key in [k for k, (_, v) in self._entries.items() if predicate(k, v)]:
+            del self._entries[key]
+    
+    def get_stats(self) -> dict:
+        """Get cache counters."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,506 @@
+"""
+Token-budgeted conversation history for the model connector.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from langchain_core.messages import (
+    BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage, messages_from_dict, messages_to_dict
+)
+
+from .prompts import PROMPT_VERSION
+
+# Budżet tokenów całego promptu (system prompt + historia)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "16000"))
+
+# Po przekroczeniu budżetu historia jest kompaktowana do tej części budżetu pozostałej
+# po system prompcie, żeby kolejne tury tylko dopisywały wiadomości (stabilny prefiks =
+# cache dostawcy)
+HISTORY_LOW_WATER = float(os.environ.get("HISTORY_LOW_WATER", "0.6"))
+
+# Tyle ostatnich wiadomości nigdy nie jest skracanych ani streszczanych (co najmniej 1 -
+# bieżąca wiadomość użytkownika)
+HISTORY_KEEP_RECENT = int(os.environ.get("HISTORY_KEEP_RECENT", "6"))
+if HISTORY_KEEP_RECENT < 1:
+    raise ValueError(f"HISTORY_KEEP_RECENT must be at least 1, got {HISTORY_KEEP_RECENT}")
+
+# Przybliżenie: średnio ~3 znaki polskiego tekstu na token + narzut na wiadomość
+CHARS_PER_TOKEN = 3
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Przybliżony koszt pamięci: obiekt wiadomości + ~2 bajty na znak polskiego tekstu
+MESSAGE_OVERHEAD_BYTES = 600
+BYTES_PER_CHAR = 2
+
+TOOL_RESULTS_PREFIX = "TOOL_RESULTS:"
+SHRUNK_TOOL_RESULTS_PREFIX = "TOOL_RESULTS (skrócone):"
+SUMMARY_PREFIX = "PODSUMOWANIE WCZEŚNIEJSZEJ CZĘŚCI ROZMOWY:"
+
+# Fakty, które muszą przetrwać skracanie historii
+FACT_PATTERNS = {
+    "customer_id": [
+        re.compile(r"ID klienta:\s*(\d+)"),
+        re.compile(r"🔑 ID:\s*(\d+)"),
+        re.compile(r"\[(?:CHECK_INVOICES|CREATE_ORDER):\s*(\d+)", re.IGNORECASE),
+        re.compile(r"\bcustomer_id=([\d,]+)"),
+    ],
+    "pesel": [
+        re.compile(r"(?<!\d)(\d{11})(?!\d)"),
+    ],
+    "order_id": [
+        re.compile(r"Numer zamówienia:\s*(\d+)"),
+        re.compile(r"\border_id=([\d,]+)"),
+    ],
+    "ordered_product_ids": [
+        re.compile(r"ID produktu:\s*(\d+)"),
+        re.compile(r"\[CREATE_ORDER:\s*\d+\s*,\s*([\d,\s]+)\]", re.IGNORECASE),
+        re.compile(r"\bordered_product_ids=([\d,]+)"),
+    ],
+}
+
+# Pozycja katalogu: "• 100 kanałów" ... "🆔 ID: 5"
+CATALOG_ITEM_PATTERN = re.compile(r"•\s*([^\n]+)\n\s*💰 Cena:\s*([^\n]+)\n[^\n]*\n\s*🆔 ID:\s*(\d+)")
+
+# Pozycja katalogu w formacie zwięzłym: "product_id=5|type=TV|name=100 kanałów|priceMax=49.99|..."
+COMPACT_CATALOG_ITEM_PATTERN = re.compile(r"product_id=(\d+)\|(?:type=[^|\n]*\|)?name=([^|\n]+)\|priceMax=([^|\n]+)")
+
+TOOL_COMMAND_PATTERN = re.compile(r"WYNIK NARZĘDZIA (\[[^\]]+\])")
+
+PRODUCTS_LINE_PREFIX = "produkty (id=nazwa): "
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens of a message.
+    
+    Args:
+        text: Message content
+        
+    Returns:
+        Estimated token count
+    """
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def extract_facts(text: str) -> Dict[str, List[str]]:
+    """
+    Extract ids and other facts that must survive history compaction.
+    
+    Args:
+        text: Message content
+        
+    Returns:
+        Dictionary fact name -> list of unique values (in order of appearance)
+    """
+    facts = {}
+    for name, patterns in FACT_PATTERNS.items():
+        values = []
+        for pattern in patterns:
+            for match in pattern.findall(text):
+                for value in re.split(r"[,\s]+", match):
+                    if value and value not in values:
+                        values.append(value)
+        if values:
+            facts[name] = values
+    return facts
+
+
+def _merge_facts(target: Dict[str, List[str]], source: Dict[str, List[str]]):
+    """Merge extracted facts, keeping the order of first appearance."""
+    for name, values in source.items():
+        bucket = target.setdefault(name, [])
+        for value in values:
+            if value not in bucket:
+                bucket.append(value)
+
+
+def _format_facts(facts: Dict[str, List[str]]) -> str:
+    """Render facts as a compact "name=v1,v2" line."""
+    return " | ".join(f"{name}={','.join(values)}" for name, values in facts.items())
+
+
+def _preview(text: str, limit: int = 80) -> str:
+    """Single-line preview of a message."""
+    text = " ".join(text.split())
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+class ConversationHistory:
+    """
+    Conversation history that keeps the prompt under a token budget.
+    
+    Every message carries an estimated token count. When the total exceeds
+    the budget, old TOOL_RESULTS blocks are shrunk to the ids they carried
+    first; if that is not enough, older turns are folded into a single
+    summary message placed right after the system prompt.
+    
+    Compaction goes down to a low-water mark below the budget, so between
+    compactions the history is append-only and the request prefix stays
+    byte-identical (which is what provider prompt caching needs).
+    """
+    
+    def __init__(
+        self,
+        system_prompt: str,
+        token_budget: Optional[int] = None,
+        keep_recent: Optional[int] = None,
+        low_water: Optional[float] = None
+    ):
+        """
+        Initialize the history.
+        
+        Args:
+            system_prompt: System prompt (always kept as the first message)
+            token_budget: Maximum estimated prompt tokens
+            keep_recent: Number of most recent messages never compacted (at least 1)
+            low_water: Fraction of the budget left after the system prompt to
+                compact down to
+            
+        Raises:
+            ValueError: If keep_recent is smaller than 1
+        """
+        self.token_budget = token_budget or HISTORY_TOKEN_BUDGET
+        self.low_water = low_water if low_water is not None else HISTORY_LOW_WATER
+        self.keep_recent = keep_recent if keep_recent is not None else HISTORY_KEEP_RECENT
+        if self.keep_recent < 1:
+            raise ValueError(f"HISTORY_KEEP_RECENT must be at least 1, got {self.keep_recent}")
+        self.messages: List[BaseMessage] = []
+        self._tokens: List[int] = []
+        self.token_count = 0
+        self.char_count = 0
+        self.counts = {"user": 0, "ai": 0, "system": 0, "other": 0}
+        self.compactions = 0
+        self.append(SystemMessage(content=system_prompt))
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    # Accounting (kept incrementally so stats are O(1))
+    
+    @staticmethod
+    def _kind(message: BaseMessage) -> str:
+        if isinstance(message, HumanMessage):
+            return "user"
+        if isinstance(message, AIMessage):
+            return "ai"
+        if isinstance(message, SystemMessage):
+            return "system"
+        return "other"
+    
+    def _account(self, message: BaseMessage, sign: int):
+        """Add (sign=1) or remove (sign=-1) a message from the counters."""
+        self.counts[self._kind(message)] += sign
+        self.char_count += sign * len(message.content)
+    
+    def _recount(self):
+        """Rebuild all counters after a bulk change."""
+        self.token_count = sum(self._tokens)
+        self.char_count = 0
+        self.counts = dict.fromkeys(self.counts, 0)
+        for message in self.messages:
+            self._account(message, 1)
+    
+    def estimated_bytes(self) -> int:
+        """
+        Estimate memory held by this history.
+        
+        The first system prompt is shared between sessions and not counted.
+        
+        Returns:
+            Approximate size in bytes
+        """
+        chars = self.char_count
+        if self.messages and isinstance(self.messages[0], SystemMessage):
+            chars -= len(self.messages[0].content)
+        return len(self.messages) * MESSAGE_OVERHEAD_BYTES + chars * BYTES_PER_CHAR
+    
+    # Mutation
+    
+    def append(self, message: BaseMessage):
+        """
+        Append a message to the history.
+        
+        Args:
+            message: LangChain message
+        """
+        tokens = estimate_tokens(message.content)
+        self.messages.append(message)
+        self._tokens.append(tokens)
+        self.token_count += tokens
+        self._account(message, 1)
+    
+    def rollback_to(self, message: BaseMessage) -> bool:
+        """
+        Remove a message and everything appended after it (e.g. an aborted turn).
+        
+        Args:
+            message: The exact message object that started the turn
+            
+        Returns:
+            True if the message was found (it may be gone after compaction)
+        """
+        for index in range(len(self.messages) - 1, 0, -1):
+            if self.messages[index] is message:
+                break
+        else:
+            return False
+        
+        while len(self.messages) > index:
+            self.token_count -= self._tokens.pop()
+            self._account(self.messages.pop(), -1)
+        return True
+    
+    def messages_since(self, message: BaseMessage) -> List[BaseMessage]:
+        """
+        Get the messages appended after a message.
+        
+        Args:
+            message: The exact message object (e.g. the user message of a turn)
+            
+        Returns:
+            Messages following it (empty if it is not in the history)
+        """
+        for index in range(len(self.messages) - 1, 0, -1):
+            if self.messages[index] is message:
+                return self.messages[index + 1:]
+        return []
+    
+    def _replace(self, index: int, message: BaseMessage):
+        """Replace the message at index, keeping token accounting in sync."""
+        tokens = estimate_tokens(message.content)
+        self.token_count += tokens - self._tokens[index]
+        self._account(self.messages[index], -1)
+        self._account(message, 1)
+        self.messages[index] = message
+        self._tokens[index] = tokens
+    
+    def reset(self, keep_system_prompt: bool = True):
+        """
+        Clear the history.
+        
+        Args:
+            keep_system_prompt: If True, keeps the system prompt
+        """
+        keep = 1 if keep_system_prompt and self.messages else 0
+        self.messages = self.messages[:keep]
+        self._tokens = self._tokens[:keep]
+        self._recount()
+    
+    def set_system_prompt(self, prompt: str):
+        """
+        Update (or insert) the system prompt.
+        
+        Changes the request prefix, so the provider's prompt cache starts over.
+        
+        Args:
+            prompt: New system prompt text
+        """
+        message = SystemMessage(content=prompt)
+        if self.messages and isinstance(self.messages[0], SystemMessage):
+            self._replace(0, message)
+        else:
+            tokens = estimate_tokens(prompt)
+            self.messages.insert(0, message)
+            self._tokens.insert(0, tokens)
+            self.token_count += tokens
+            self._account(message, 1)
+    
+    # Serialization
+    
+    def to_dict(self) -> dict:
+        """
+        Serialize the history (without the system prompt, which is shared).
+        
+        Returns:
+            JSON-serializable dictionary
+        """
+        has_prompt = bool(self.messages) and isinstance(self.messages[0], SystemMessage)
+        return {
+            "prompt_version": PROMPT_VERSION,
+            "system_prompt": has_prompt,
+            "messages": messages_to_dict(self.messages[1 if has_prompt else 0:]),
+            "compactions": self.compactions,
+        }
+    
+    def load_dict(self, data: dict):
+        """
+        Restore messages saved with to_dict, keeping the current system prompt.
+        
+        A history saved under a different PROMPT_VERSION was produced by other
+        instructions (e.g. another tool grammar); it is folded into a single
+        summary so the model only sees its facts, not the old conventions.
+        
+        Args:
+            data: Dictionary produced by to_dict
+        """
+        keep = 1 if data.get("system_prompt", True) and self.messages else 0
+        restored = messages_from_dict(data.get("messages", []))
+        self.messages = self.messages[:keep] + restored
+        self._tokens = self._tokens[:keep] + [estimate_tokens(m.content) for m in restored]
+        self.compactions = data.get("compactions", 0)
+        self._recount()
+        
+        if keep and restored and data.get("prompt_version") != PROMPT_VERSION:
+            before = self.token_count
+            self._summarize_old_turns(end=len(self.messages))
+            if self.token_count < before:
+                self.compactions += 1
+    
+    # Compaction
+    
+    @property
+    def compact_target(self) -> int:
+        """
+        Token count that compaction goes down to.
+        
+        The system prompt is never compacted, so the low-water fraction applies
+        only to the budget left after it. A fraction of the whole budget would
+        mostly be taken by the system prompt and leave the conversation little
+        room before the next compaction.
+        """
+        fixed = self._tokens[0] if self.messages and isinstance(self.messages[0], SystemMessage) else 0
+        return fixed + int(max(0, self.token_budget - fixed) * self.low_water)
+    
+    @staticmethod
+    def is_tool_results(message: BaseMessage) -> bool:
+        """Check whether a message is a full TOOL_RESULTS block (or native tool result)."""
+        if isinstance(message, ToolMessage):
+            return not message.content.startswith(SHRUNK_TOOL_RESULTS_PREFIX)
+        return isinstance(message, HumanMessage) and message.content.startswith(TOOL_RESULTS_PREFIX)
+    
+    @staticmethod
+    def is_summary(message: BaseMessage) -> bool:
+        """Check whether a message is a compaction summary."""
+        return isinstance(message, SystemMessage) and message.content.startswith(SUMMARY_PREFIX)
+    
+    def fit_to_budget(self) -> bool:
+        """
+        Compact the history once it exceeds the token budget.
+        
+        Returns:
+            True if compaction reduced the token count
+        """
+        if self.token_count <= self.token_budget:
+            return False
+        
+        before = self.token_count
+        self._shrink_tool_results()
+        if self.token_count > self.compact_target:
+            self._summarize_old_turns()
+        
+        # Nic do skrócenia (np. same ostatnie wiadomości) - to nie jest kompakcja
+        if self.token_count >= before:
+            return False
+        self.compactions += 1
+        return True
+    
+    def _protected_from(self) -> int:
+        """Index of the first message that must stay untouched."""
+        return max(1, len(self.messages) - self.keep_recent)
+    
+    def _shrink_tool_results(self):
+        """Replace old TOOL_RESULTS blocks (oldest first) with their ids only."""
+        for index in range(1, self._protected_from()):
+            if self.token_count <= self.compact_target:
+                return
+            message = self.messages[index]
+            if isinstance(message, ToolMessage) and self.is_tool_results(message):
+                # Odpowiedź na wywołanie funkcji musi zachować tool_call_id
+                self._replace(index, ToolMessage(
+                    content=self._shrink_tool_block(message.content),
+                    tool_call_id=message.tool_call_id
+                ))
+            elif self.is_tool_results(message):
+                self._replace(index, HumanMessage(content=self._shrink_tool_block(message.content)))
+    
+    @staticmethod
+    def _shrink_tool_block(text: str) -> str:
+        """Build the short form of a TOOL_RESULTS block."""
+        lines = [SHRUNK_TOOL_RESULTS_PREFIX]
+        
+        commands = TOOL_COMMAND_PATTERN.findall(text)
+        if commands:
+            lines.append("narzędzia: " + ", ".join(commands))
+        
+        facts = extract_facts(text)
+        if facts:
+            lines.append(_format_facts(facts))
+        
+        products = [
+            f"{product_id}={_preview(name, 40)} ({_preview(price, 40)})"
+            for name, price, product_id in CATALOG_ITEM_PATTERN.findall(text)
+        ]
+        products.extend(
+            f"{product_id}={_preview(name, 40)} ({price})"
+            for product_id, name, price in COMPACT_CATALOG_ITEM_PATTERN.findall(text)
+        )
+        if products:
+            lines.append(PRODUCTS_LINE_PREFIX + "; ".join(products))
+        
+        return "\n".join(lines)
+    
+    def _summarize_old_turns(self, end: Optional[int] = None):
+        """
+        Fold old messages into one summary message.
+        
+        Args:
+            end: Summarize messages before this index (default: everything
+                except the recent tail)
+        """
+        start = 1
+        facts: Dict[str, List[str]] = {}
+        user_previews: List[str] = []
+        products_line = None
+        
+        # Poprzednie podsumowanie jest łączone z nowym
+        if len(self.messages) > 1 and self.is_summary(self.messages[1]):
+            previous = self.messages[1].content
+            _merge_facts(facts, extract_facts(previous))
+            for line in previous.splitlines():
+                if line.startswith("- "):
+                    user_previews.append(line[2:])
+                elif line.startswith(PRODUCTS_LINE_PREFIX):
+                    products_line = line
+            start = 2
+        
+        if end is None:
+            # Ogon zaczyna się od wiadomości użytkownika, żeby nie rozcinać tury
+            end = self._protected_from()
+            while end > start and not self._is_user_turn(self.messages[end]):
+                end -= 1
+        if end <= start:
+            return
+        
+        for message in self.messages[start:end]:
+            _merge_facts(facts, extract_facts(message.content))
+            if self._is_user_turn(message):
+                user_previews.append(_preview(message.content))
+            elif message.content.startswith(SHRUNK_TOOL_RESULTS_PREFIX):
+                for line in message.content.splitlines():
+                    if line.startswith(PRODUCTS_LINE_PREFIX):
+                        products_line = line
+        
+        lines = [SUMMARY_PREFIX]
+        if facts:
+            lines.append("Ważne dane: " + _format_facts(facts))
+        if products_line:
+            lines.append(products_line)
+        if user_previews:
+            lines.append("Wcześniejsze pytania klienta:")
+            lines.extend(f"- {preview}" for preview in user_previews[-10:])
+        
+        summary = SystemMessage(content="\n".join(lines))
+        summary_tokens = estimate_tokens(summary.content)
+        
+        self.messages[1:end] = [summary]
+        self._tokens[1:end] = [summary_tokens]
+        self._recount()
+    
+    def _is_user_turn(self, message: BaseMessage) -> bool:
+        """Check whether a message is a real user message (not tool results)."""
+        return (
+            isinstance(message, HumanMessage)
+            and not message.content.startswith((TOOL_RESULTS_PREFIX, SHRUNK_TOOL_RESULTS_PREFIX))
+        )
@@ -0,0 +1,150 @@
+"""
+Process-wide LLM client shared by all sessions.
+"""
+
+import os
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+# Pula połączeń HTTP do dostawcy modelu (wspólna dla wszystkich sesji)
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "200"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "50"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+
+_llm: Optional[ChatOpenAI] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Surowe "usage" ostatniego streamu w bieżącym zadaniu (langchain-openai 0.1.x
+# gubi prompt_tokens_details.cached_tokens przy konwersji chunków)
+_raw_usage: ContextVar[Optional[dict]] = ContextVar("llm_raw_usage", default=None)
+
+
+class _UsageRecordingStream:
+    """Passes a streamed completion through, remembering its usage chunk."""
+    
+    def __init__(self, stream):
+        self._stream = stream
+    
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return await self._stream.__aexit__(*exc_info)
+    
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                _raw_usage.set(usage.model_dump())
+            yield chunk
+
+
+class _UsageRecordingCompletions:
+    """Wraps the OpenAI chat.completions resource used by ChatOpenAI."""
+    
+    def __init__(self, completions):
+        self._completions = completions
+    
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+    
+    async def create(self, **payload):
+        response = await self._completions.create(**payload)
+        return _UsageRecordingStream(response) if payload.get("stream") else response
+
+
+# Sumaryczne zużycie tokenów w procesie
+_usage_totals = {"llm_calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+
+
+def record_usage(usage: dict):
+    """
+    Add one call's token usage to the process totals.
+    
+    Args:
+        usage: Dictionary with the keys of _usage_totals
+    """
+    for key in _usage_totals:
+        _usage_totals[key] += usage.get(key, 0)
+
+
+def get_usage_stats() -> dict:
+    """Get process-wide token usage with the prompt cache hit ratio."""
+    stats = dict(_usage_totals)
+    inputs = stats["input_tokens"]
+    stats["cached_ratio"] = round(stats["cached_input_tokens"] / inputs, 3) if inputs else 0.0
+    return stats
+
+
+def reset_usage():
+    """Forget the usage recorded in the current task (call before a stream)."""
+    _raw_usage.set(None)
+
+
+def last_usage() -> Optional[dict]:
+    """
+    Get the raw usage of the last stream in the current task.
+    
+    Returns:
+        OpenAI usage dict (prompt_tokens, completion_tokens,
+        prompt_tokens_details.cached_tokens, ...) or None
+    """
+    return _raw_usage.get()
+
+
+def get_llm() -> ChatOpenAI:
+    """
+    Get the shared chat model, creating it on first use.
+    
+    Returns:
+        ChatOpenAI instance backed by one pooled async HTTP client
+    """
+    global _llm, _http_client
+    if _llm is None:
+        _http_client = httpx.AsyncClient(
+            timeout=LLM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _llm = ChatOpenAI(
+            base_url="https://api.scaleway.ai/2d6e7638-f7f5-41f4-b61c-79209c1785be/v1",
+            api_key=os.environ.get("SCW_SECRET_KEY"),
+            model="gpt-oss-120b",
+            max_tokens=2048,
+            temperature=1,
+            top_p=1,
+            presence_penalty=0,
+            streaming=True,
+            stream_usage=True,
+            http_async_client=_http_client
+        )
+        _llm.async_client = _UsageRecordingCompletions(_llm.async_client)
+    return _llm
+
+
+def set_llm(llm):
+    """
+    Replace the shared chat model (e.g. with a fake model in benchmarks).
+    
+    Args:
+        llm: Chat model used by every session without its own model
+    """
+    global _llm
+    _llm = llm
+
+
+async def close_llm():
+    """Close the shared HTTP client (called on application shutdown)."""
+    global _llm, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _llm = None
+    _http_client = None
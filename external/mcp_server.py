@@ -1,37 +1,255 @@
 import httpx
 import os
+import json
+import asyncio
+import hashlib
+import time
+from bisect import bisect_right
 from mcp.server import FastMCP
 from typing import Optional, List
 from datetime import datetime
 
+from .cache import LRUTTLCache, SingleFlight, StaleWhileRevalidateCache
+from .metrics import observe_backend
+from .resilience import CircuitBreaker, RetryBudget
+
 # Create MCP server instance
 mcp = FastMCP("next-gen-sales-service")
 
 # Backend configuration
 JAVA_BACKEND_URL = os.environ.get("SALES_API_URL", "http://localhost:8080")
 
+# Pula połączeń do backendu (jeden klient na cały proces)
+SALES_API_TIMEOUT = float(os.environ.get("SALES_API_TIMEOUT", "10"))
+SALES_API_MAX_CONNECTIONS = int(os.environ.get("SALES_API_MAX_CONNECTIONS", "100"))
+SALES_API_MAX_KEEPALIVE = int(os.environ.get("SALES_API_MAX_KEEPALIVE", "20"))
+SALES_API_KEEPALIVE_EXPIRY = float(os.environ.get("SALES_API_KEEPALIVE_EXPIRY", "30"))
+SALES_API_HTTP2 = os.environ.get("SALES_API_HTTP2", "1") == "1"
+
+
+def _parse_timeouts(spec: str) -> dict:
+    """Parsuje limity czasu per endpoint, np. "customer=3,order=15" """
+    timeouts = {}
+    for item in spec.split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            timeouts[endpoint.strip()] = float(seconds)
+    return timeouts
+
+
+# Limity czasu per endpoint (pozostałe endpointy: SALES_API_TIMEOUT)
+SALES_API_TIMEOUTS = _parse_timeouts(os.environ.get(
+    "SALES_API_TIMEOUTS", "customer=3,invoices=4,component-catalog=5,order=15"
+))
+# Ponowienia tylko dla idempotentnych GET-ów, nigdy dla zamówień (POST)
+SALES_API_RETRIES = int(os.environ.get("SALES_API_RETRIES", "1"))
+SALES_API_RETRY_BUDGET = float(os.environ.get("SALES_API_RETRY_BUDGET", "0.1"))
+SALES_API_RETRY_BACKOFF = float(os.environ.get("SALES_API_RETRY_BACKOFF", "0.1"))
+# Circuit breaker: po tylu błędach z rzędu endpoint jest odcinany na SALES_API_BREAKER_COOLDOWN s
+SALES_API_BREAKER_FAILURES = int(os.environ.get("SALES_API_BREAKER_FAILURES", "5"))
+SALES_API_BREAKER_COOLDOWN = float(os.environ.get("SALES_API_BREAKER_COOLDOWN", "15"))
+
+# Komunikat dla modelu, gdy backend jest odcięty (zapytanie nie zostało wysłane)
+BACKEND_UNAVAILABLE = (
+    "System sprzedażowy jest chwilowo niedostępny, zapytanie nie zostało wykonane. "
+    "Poproś klienta o ponowienie próby za kilka minut."
+)
+
+# Cache katalogu produktów (katalog zmienia się rzadko)
+CATALOG_CACHE_TTL = float(os.environ.get("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_STALE_TTL = float(os.environ.get("CATALOG_CACHE_STALE_TTL", "3600"))
+# Ile różnych zapytań filtrowanych zapamiętać (sformatowanych) na jedną wersję katalogu
+CATALOG_QUERY_CACHE_SIZE = int(os.environ.get("CATALOG_QUERY_CACHE_SIZE", "64"))
+# Grupa produktów bez typu (nagłówek w katalogu i wartość filtra typu GET_CATALOG)
+CATALOG_UNTYPED = "INNE"
+
+# Krótki cache klientów i faktur (po PESEL / customer_id)
+CUSTOMER_CACHE_TTL = float(os.environ.get("CUSTOMER_CACHE_TTL", "30"))
+CUSTOMER_CACHE_SIZE = int(os.environ.get("CUSTOMER_CACHE_SIZE", "1024"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Jednoczesne identyczne zapytania GET współdzielą jedno wywołanie backendu
+_backend_flight = SingleFlight()
+
+_retry_budget = RetryBudget(SALES_API_RETRY_BUDGET)
+_breakers = {}
+
+customer_cache = LRUTTLCache(maxsize=CUSTOMER_CACHE_SIZE, ttl=CUSTOMER_CACHE_TTL)
+
+
+# --- Utility: shared HTTP client ---
+def _http2_available() -> bool:
+    """Sprawdza czy zainstalowano opcjonalną paczkę h2 (wymaganą przez HTTP/2)"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Zwraca współdzielonego klienta HTTP (tworzy go przy pierwszym użyciu)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=SALES_API_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SALES_API_MAX_CONNECTIONS,
+                max_keepalive_connections=SALES_API_MAX_KEEPALIVE,
+                keepalive_expiry=SALES_API_KEEPALIVE_EXPIRY,
+            ),
+            http2=SALES_API_HTTP2 and _http2_available(),
+        )
+    return _http_client
+
+
+async def start_http_client():
+    """Otwiera współdzielonego klienta HTTP (wywoływane przy starcie aplikacji)"""
+    get_http_client()
+
+
+async def close_http_client():
+    """Zamyka współdzielonego klienta HTTP i jego pulę połączeń"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 # --- Utility: async request helper ---
 async def call_java_backend(endpoint: str, method="GET", params=None, data=None):
-    """Asynchroniczne wywołanie backend API"""
+    """Asynchroniczne wywołanie backend API (identyczne równoległe GET-y są łączone)"""
+    if method != "GET":
+        return await _request_backend(endpoint, method, params, data)
+    
+    key = (endpoint, tuple(sorted((params or {}).items())))
+    return await _backend_flight.do(key, lambda: _request_backend(endpoint, method, params, data))
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """Zwraca circuit breaker endpointu (tworzy go przy pierwszym użyciu)"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(SALES_API_BREAKER_FAILURES, SALES_API_BREAKER_COOLDOWN)
+    return breaker
+
+
+def is_backend_failure(result) -> bool:
+    """Błąd świadczący o problemie backendu (timeout, brak połączenia, 5xx) - nie 4xx"""
+    if not (isinstance(result, dict) and "error" in result):
+        return False
+    status_code = result.get("status_code")
+    return status_code is None or status_code >= 500
+
+
+async def _request_backend(endpoint: str, method="GET", params=None, data=None):
+    """Wywołanie backendu z circuit breakerem i ponowieniami (czas i wynik trafiają do metryk)"""
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        observe_backend(endpoint, method, 0.0, "circuit_open")
+        return {"error": BACKEND_UNAVAILABLE, "circuit_open": True}
+    
+    started = time.perf_counter()
+    result = await _request_with_retries(endpoint, method, params, data)
+    
+    if is_backend_failure(result):
+        breaker.record_failure()
+        outcome = "error"
+    else:
+        breaker.record_success()
+        outcome = "not_found" if isinstance(result, dict) and result.get("status_code") == 404 else "ok"
+    observe_backend(endpoint, method, time.perf_counter() - started, outcome)
+    return result
+
+
+async def _request_with_retries(endpoint: str, method="GET", params=None, data=None):
+    """Ponawia nieudane GET-y (w ramach budżetu ponowień); POST wysyłany jest dokładnie raz"""
+    timeout = SALES_API_TIMEOUTS.get(endpoint, SALES_API_TIMEOUT)
+    retries = SALES_API_RETRIES if method == "GET" else 0
+    if retries:
+        _retry_budget.record_request()
+    
+    attempt = 0
+    while True:
+        result = await _send_backend_request(endpoint, method, params, data, timeout)
+        if attempt >= retries or not is_backend_failure(result) or not _retry_budget.try_spend():
+            return result
+        attempt += 1
+        await asyncio.sleep(SALES_API_RETRY_BACKOFF * attempt)
+
+
+async def _send_backend_request(endpoint: str, method="GET", params=None, data=None, timeout=SALES_API_TIMEOUT):
+    """Wysyła zapytanie HTTP i zamienia błędy na słownik {"error": ...}"""
     url = f"{JAVA_BACKEND_URL}/{endpoint}"
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            if method == "GET":
-                res = await client.get(url, params=params)
-            elif method == "POST":
-                res = await client.post(url, json=data)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
+        client = get_http_client()
+        if method == "GET":
+            res = await client.get(url, params=params, timeout=timeout)
+        elif method == "POST":
+            res = await client.post(url, json=data, timeout=timeout)
+        else:
+            raise ValueError(f"Unsupported method: {method}")
 
-            res.raise_for_status()
-            return res.json()
+        res.raise_for_status()
+        return res.json()
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
             return {"error": "Not found", "status_code": 404}
         return {"error": f"HTTP {e.response.status_code}: {str(e)}", "status_code": e.response.status_code}
+    except httpx.TimeoutException:
+        return {"error": f"Backend nie odpowiedział w ciągu {timeout:g} s"}
     except Exception as e:
-        return {"error": str(e)}
+        return {"error": str(e) or type(e).__name__}
+
+
+def get_backend_stats() -> dict:
+    """Stan połączenia z backendem: circuit breakery, budżet ponowień i limity czasu"""
+    return {
+        "breakers": {endpoint: breaker.get_stats() for endpoint, breaker in _breakers.items()},
+        "retry_budget": _retry_budget.get_stats(),
+        "timeouts": dict(SALES_API_TIMEOUTS, default=SALES_API_TIMEOUT),
+    }
+
+
+# --- Cached lookups ---
+async def fetch_customer(pesel: str) -> dict:
+    """Pobiera dane klienta po PESEL (z krótkiego cache)"""
+    key = ("customer", pesel)
+    cached = customer_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    generation = customer_cache.generation
+    customer_data = await call_java_backend("customer", params={"pesel": pesel})
+    if isinstance(customer_data, dict) and "error" not in customer_data:
+        customer_cache.set(key, customer_data, generation)
+    return customer_data
+
+
+async def fetch_invoices(customer_id) -> list:
+    """Pobiera faktury klienta po customer_id (z krótkiego cache)"""
+    key = ("invoices", str(customer_id))
+    cached = customer_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    generation = customer_cache.generation
+    invoices_data = await call_java_backend("invoices", params={"customerId": customer_id})
+    if not (isinstance(invoices_data, dict) and "error" in invoices_data):
+        customer_cache.set(key, invoices_data, generation)
+    return invoices_data
+
+
+def invalidate_customer(customer_id):
+    """Usuwa z cache dane i faktury klienta (np. po złożeniu zamówienia)"""
+    customer_id = str(customer_id)
+    customer_cache.invalidate_where(
+        lambda key, value: (
+            (key[0] == "invoices" and key[1] == customer_id)
+            or (key[0] == "customer" and str(value.get("id")) == customer_id)
+        )
+    )
 
 
 # --- Formatting helpers ---
@@ -46,12 +264,67 @@ def format_date(date_str: str) -> str:
         return date_str
 
 
-def format_customer_info(customer_data: dict) -> str:
-    """Formatuje dane klienta do czytelnej formy"""
+def format_compact(**fields) -> str:
+    """Zwięzła linia key=value dla modelu (pomija puste pola)"""
+    return "|".join(f"{key}={value}" for key, value in fields.items() if value not in (None, ''))
+
+
+ORDER_STATUS_PL = {
+    'NEW': 'Nowe',
+    'PENDING': 'W trakcie',
+    'PROCESSING': 'Przetwarzane',
+    'COMPLETED': 'Zrealizowane',
+    'CANCELLED': 'Anulowane'
+}
+
+ORDER_ITEM_STATUS_PL = {
+    'NEW': 'Nowy',
+    'PENDING': 'W trakcie',
+    'PROCESSING': 'Przetwarzany',
+    'COMPLETED': 'Zrealizowany',
+    'CANCELLED': 'Anulowany'
+}
+
+INVOICE_STATUS_PL = {
+    'PAID': ('✅', 'Opłacona'),
+    'UNPAID': ('⚠️', 'Nieopłacona'),
+    'OVERDUE': ('🔴', 'Po terminie'),
+    'CANCELLED': ('❌', 'Anulowana'),
+}
+
+
+def format_customer_info(customer_data: dict, compact: bool = False) -> str:
+    """Formatuje dane klienta do czytelnej formy (lub zwięzłej dla modelu)"""
     if "error" in customer_data:
         return f"❌ {customer_data['error']}"
     
-    info = f"""
+    services = customer_data.get('services', [])
+    
+    if compact:
+        lines = [format_compact(
+            customer_id=customer_data.get('id'),
+            name=f"{customer_data.get('firstName', '')} {customer_data.get('lastName', '')}".strip(),
+            pesel=customer_data.get('pesel'),
+            email=customer_data.get('email'),
+            status=customer_data.get('status'),
+            type=customer_data.get('type'),
+            services=len(services)
+        )]
+        for service in services:
+            lines.append("service " + format_compact(
+                name=service.get('serviceName'),
+                type=service.get('type'),
+                status=service.get('status'),
+                sim=service.get('simNumber') if service.get('sim') else None
+            ))
+            for comp in service.get('components', []):
+                lines.append(" component " + format_compact(
+                    name=comp.get('name'),
+                    value=f"{comp.get('parameterValue', '')} {comp.get('parameterName', '')}".strip()
+                ))
+        return "\n".join(lines)
+    
+    parts = [f"""
 📋 Informacje o kliencie:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 👤 Imię i nazwisko: {customer_data.get('firstName', '')} {customer_data.get('lastName', '')}
@@ -61,52 +334,68 @@ def format_customer_info(customer_data: dict) -> str:
 📊 Status: {customer_data.get('status', 'nieznany')}
 👥 Typ: {customer_data.get('type', 'nieznany')}
 
-"""
+"""]
     
-    services = customer_data.get('services', [])
     if services:
-        info += f"📦 Aktywne usługi ({len(services)}):\n"
+        parts.append(f"📦 Aktywne usługi ({len(services)}):\n")
         for idx, service in enumerate(services, 1):
-            info += f"\n{idx}. {service.get('serviceName', 'Usługa')}\n"
-            info += f"   ├─ Typ: {service.get('type', 'brak')}\n"
-            info += f"   ├─ Status: {service.get('status', 'brak')}\n"
+            parts.append(f"\n{idx}. {service.get('serviceName', 'Usługa')}\n")
+            parts.append(f"   ├─ Typ: {service.get('type', 'brak')}\n")
+            parts.append(f"   ├─ Status: {service.get('status', 'brak')}\n")
             
             if service.get('sim'):
-                info += f"   ├─ SIM: {service.get('simNumber', 'brak')} ({service.get('simType', 'brak')})\n"
+                parts.append(f"   ├─ SIM: {service.get('simNumber', 'brak')} ({service.get('simType', 'brak')})\n")
             
             components = service.get('components', [])
             if components:
-                info += f"   └─ Komponenty ({len(components)}):\n"
+                parts.append(f"   └─ Komponenty ({len(components)}):\n")
                 for comp in components:
-                    info += f"      • {comp.get('name', 'brak')} - {comp.get('parameterValue', '')} {comp.get('parameterName', '')}\n"
+                    parts.append(f"      • {comp.get('name', 'brak')} - {comp.get('parameterValue', '')} {comp.get('parameterName', '')}\n")
     else:
-        info += "📦 Brak aktywnych usług\n"
+        parts.append("📦 Brak aktywnych usług\n")
     
-    return info
+    return "".join(parts)
+
+
+def catalog_item_type(item: dict) -> str:
+    """Typ produktu z katalogu wielkimi literami (CATALOG_UNTYPED, gdy go brak)"""
+    return str(item.get('type') or CATALOG_UNTYPED).upper()
 
 
-def format_catalog(catalog_data: list) -> str:
-    """Formatuje katalog produktów do czytelnej formy"""
+def format_catalog(catalog_data: list, compact: bool = False, filters: Optional[dict] = None) -> str:
+    """Formatuje katalog produktów do czytelnej formy (lub zwięzłej dla modelu)"""
     if not catalog_data or isinstance(catalog_data, dict) and "error" in catalog_data:
         return "❌ Brak dostępnych produktów w katalogu"
     
-    info = f"""
-🛍️ Katalog dostępnych produktów ({len(catalog_data)}):
+    filters = filters or {}
+    if compact:
+        lines = [format_compact(catalog_items=len(catalog_data), **filters)]
+        for item in catalog_data:
+            lines.append(format_compact(
+                product_id=item.get('id'),
+                type=catalog_item_type(item),
+                name=f"{item.get('parameterValue', '')} {item.get('parameterName', '')}".strip(),
+                priceMax=item.get('priceMax'),
+                priceMin=item.get('priceMin'),
+                status=item.get('status')
+            ))
+        return "\n".join(lines)
+    
+    criteria = ", ".join(f"{key}={value}" for key, value in filters.items() if value not in (None, ''))
+    parts = [f"""
+🛍️ Katalog dostępnych produktów ({len(catalog_data)}){f" [{criteria}]" if criteria else ""}:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-"""
+"""]
     
     # Grupuj po typach
     by_type = {}
     for item in catalog_data:
-        item_type = item.get('type', 'Inne')
-        if item_type not in by_type:
-            by_type[item_type] = []
-        by_type[item_type].append(item)
+        by_type.setdefault(catalog_item_type(item), []).append(item)
     
     for product_type, items in by_type.items():
-        info += f"\n📱 {product_type.upper()}\n"
-        info += "─" * 40 + "\n"
+        parts.append(f"\n📱 {product_type}\n")
+        parts.append("─" * 40 + "\n")
         
         for item in items:
             param_name = item.get('parameterName', '')
@@ -114,21 +403,21 @@ def format_catalog(catalog_data: list) -> str:
             price_min = item.get('priceMin', '0')
             price_max = item.get('priceMax', '0')
             
-            info += f"\n• {param_value} {param_name}\n"
+            parts.append(f"\n• {param_value} {param_name}\n")
             
             if price_min == price_max:
-                info += f"  💰 Cena: {price_min} PLN/mies\n"
+                parts.append(f"  💰 Cena: {price_min} PLN/mies\n")
             else:
-                info += f"  💰 Cena: od {price_min} do {price_max} PLN/mies\n"
+                parts.append(f"  💰 Cena: od {price_min} do {price_max} PLN/mies\n")
             
-            info += f"  📊 Status: {item.get('status', 'nieznany')}\n"
-            info += f"  🆔 ID: {item.get('id', 'brak')}\n"
+            parts.append(f"  📊 Status: {item.get('status', 'nieznany')}\n")
+            parts.append(f"  🆔 ID: {item.get('id', 'brak')}\n")
     
-    return info
+    return "".join(parts)
 
 
-def format_order_response(order_data: dict) -> str:
-    """Formatuje odpowiedź po utworzeniu zamówienia"""
+def format_order_response(order_data: dict, compact: bool = False) -> str:
+    """Formatuje odpowiedź po utworzeniu zamówienia (lub zwięźle dla modelu)"""
     if "error" in order_data:
         return f"❌ Błąd podczas tworzenia zamówienia: {order_data['error']}"
     
@@ -137,17 +426,28 @@ def format_order_response(order_data: dict) -> str:
     customer_id = order_data.get('customerId', 'brak')
     status = order_data.get('status', 'NEW')
     create_date = order_data.get('createDate', 'brak')
+    order_items = order_data.get('orderItems', [])
+    
+    if compact:
+        lines = ["order_created " + format_compact(
+            order_id=order_id,
+            customer_id=customer_id,
+            status=status,
+            date=format_date(str(create_date)),
+            items=len(order_items)
+        )]
+        for item in order_items:
+            lines.append("item " + format_compact(
+                product_id=item.get('componentCatalogId'),
+                name=item.get('componentCatalogName'),
+                status=item.get('status')
+            ))
+        return "\n".join(lines)
     
     # Status po polsku
-    status_pl = {
-        'NEW': 'Nowe',
-        'PENDING': 'W trakcie',
-        'PROCESSING': 'Przetwarzane',
-        'COMPLETED': 'Zrealizowane',
-        'CANCELLED': 'Anulowane'
-    }.get(status, status)
-    
-    info = f"""
+    status_pl = ORDER_STATUS_PL.get(status, status)
+    
+    parts = [f"""
 ✅ Zamówienie zostało pomyślnie utworzone!
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -156,38 +456,27 @@ def format_order_response(order_data: dict) -> str:
 📅 Data utworzenia: {format_date(str(create_date))}
 📊 Status: {status_pl}
 
-"""
+"""]
     
     # Pokaż zamówione produkty z orderItems
-    order_items = order_data.get('orderItems', [])
     if order_items:
-        info += f"📦 Zamówione produkty ({len(order_items)}):\n\n"
+        parts.append(f"📦 Zamówione produkty ({len(order_items)}):\n\n")
         for idx, item in enumerate(order_items, 1):
-            component_name = item.get('componentCatalogName', 'Produkt')
-            component_id = item.get('componentCatalogId', 'brak')
             item_status = item.get('status', 'NEW')
-            item_status_pl = {
-                'NEW': 'Nowy',
-                'PENDING': 'W trakcie',
-                'PROCESSING': 'Przetwarzany',
-                'COMPLETED': 'Zrealizowany',
-                'CANCELLED': 'Anulowany'
-            }.get(item_status, item_status)
-            
-            info += f"   {idx}. {component_name}\n"
-            info += f"      ├─ ID produktu: {component_id}\n"
-            info += f"      ├─ Status: {item_status_pl}\n"
-            info += f"      └─ ID pozycji: {item.get('id', 'brak')}\n\n"
+            parts.append(f"   {idx}. {item.get('componentCatalogName', 'Produkt')}\n")
+            parts.append(f"      ├─ ID produktu: {item.get('componentCatalogId', 'brak')}\n")
+            parts.append(f"      ├─ Status: {ORDER_ITEM_STATUS_PL.get(item_status, item_status)}\n")
+            parts.append(f"      └─ ID pozycji: {item.get('id', 'brak')}\n\n")
     else:
-        info += "📦 Brak pozycji w zamówieniu (błąd systemu)\n\n"
+        parts.append("📦 Brak pozycji w zamówieniu (błąd systemu)\n\n")
     
-    info += "🎉 Dziękujemy za zamówienie! Wkrótce skontaktujemy się w sprawie realizacji."
+    parts.append("🎉 Dziękujemy za zamówienie! Wkrótce skontaktujemy się w sprawie realizacji.")
     
-    return info
+    return "".join(parts)
 
 
-def format_invoices(invoices_data: list) -> str:
-    """Formatuje listę faktur do czytelnej formy"""
+def format_invoices(invoices_data: list, compact: bool = False) -> str:
+    """Formatuje listę faktur do czytelnej formy (lub zwięzłej dla modelu)"""
     if isinstance(invoices_data, dict) and "error" in invoices_data:
         return f"❌ Błąd pobierania faktur: {invoices_data['error']}"
     
@@ -200,25 +489,42 @@ def format_invoices(invoices_data: list) -> str:
     unpaid_count = sum(1 for inv in invoices_data if inv.get('status') == 'UNPAID')
     total_unpaid = sum(float(inv.get('priceGross', 0)) for inv in invoices_data if inv.get('status') == 'UNPAID')
     
-    info = f"""
+    # Sortuj: najpierw nieopłacone, potem opłacone (od najnowszych)
+    sorted_invoices = sorted(
+        invoices_data, 
+        key=lambda x: (x.get('status') != 'UNPAID', x.get('createDate', '')),
+        reverse=True
+    )
+    
+    if compact:
+        lines = ["invoices " + format_compact(
+            total=total_invoices,
+            paid=paid_count,
+            unpaid=unpaid_count,
+            unpaid_sum=f"{total_unpaid:.2f}" if unpaid_count > 0 else None
+        )]
+        for invoice in sorted_invoices:
+            lines.append(format_compact(
+                invoice_id=invoice.get('id'),
+                status=invoice.get('status'),
+                amount=invoice.get('priceGross'),
+                period=f"{format_date(invoice.get('billingPeriodStartDate', ''))}-{format_date(invoice.get('billingPeriodEndDate', ''))}".strip('-'),
+                issued=format_date(invoice.get('createDate', ''))
+            ))
+        return "\n".join(lines)
+    
+    parts = [f"""
 💰 Faktury klienta:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📊 Wszystkich faktur: {total_invoices}
 ✅ Opłaconych: {paid_count}
 ⚠️ Nieopłaconych: {unpaid_count}
-"""
+"""]
     
     if unpaid_count > 0:
-        info += f"💸 Suma do zapłaty: {total_unpaid:.2f} PLN\n"
+        parts.append(f"💸 Suma do zapłaty: {total_unpaid:.2f} PLN\n")
     
-    info += "\n"
-    
-    # Sortuj: najpierw nieopłacone, potem opłacone (od najnowszych)
-    sorted_invoices = sorted(
-        invoices_data, 
-        key=lambda x: (x.get('status') != 'UNPAID', x.get('createDate', '')),
-        reverse=True
-    )
+    parts.append("\n")
     
     for idx, invoice in enumerate(sorted_invoices, 1):
         inv_id = invoice.get('id', 'brak')
@@ -229,34 +535,248 @@ def format_invoices(invoices_data: list) -> str:
         create_date = format_date(invoice.get('createDate', ''))
         
         # Status i emoji
-        if status == 'PAID':
-            status_emoji = '✅'
-            status_text = 'Opłacona'
-        elif status == 'UNPAID':
-            status_emoji = '⚠️'
-            status_text = 'Nieopłacona'
-        elif status == 'OVERDUE':
-            status_emoji = '🔴'
-            status_text = 'Po terminie'
-        elif status == 'CANCELLED':
-            status_emoji = '❌'
-            status_text = 'Anulowana'
-        else:
-            status_emoji = '❓'
-            status_text = status
+        status_emoji, status_text = INVOICE_STATUS_PL.get(status, ('❓', status))
         
-        info += f"\n{idx}. {status_emoji} Faktura #{inv_id}\n"
-        info += f"   ├─ Status: {status_text}\n"
-        info += f"   ├─ Kwota: {price} PLN\n"
-        info += f"   ├─ Okres rozliczeniowy: {start_date} - {end_date}\n"
-        info += f"   └─ Data wystawienia: {create_date}\n"
+        parts.append(f"\n{idx}. {status_emoji} Faktura #{inv_id}\n")
+        parts.append(f"   ├─ Status: {status_text}\n")
+        parts.append(f"   ├─ Kwota: {price} PLN\n")
+        parts.append(f"   ├─ Okres rozliczeniowy: {start_date} - {end_date}\n")
+        parts.append(f"   └─ Data wystawienia: {create_date}\n")
     
     if unpaid_count > 0:
-        info += f"\n⚠️ UWAGA: Masz {unpaid_count} nieopłaconą(ych) faktur(y) na kwotę {total_unpaid:.2f} PLN."
+        parts.append(f"\n⚠️ UWAGA: Masz {unpaid_count} nieopłaconą(ych) faktur(y) na kwotę {total_unpaid:.2f} PLN.")
     else:
-        info += "\n✅ Wszystkie faktury są opłacone!"
+        parts.append("\n✅ Wszystkie faktury są opłacone!")
+    
+    return "".join(parts)
+
+
+# --- Catalog cache ---
+def parse_price(value) -> float:
+    """Cena z katalogu jako liczba (nieczytelna cena trafia na koniec listy)"""
+    try:
+        return float(str(value).replace(",", ".").replace(" ", ""))
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+class CatalogIndex:
+    """Produkty katalogu pogrupowane po typie i posortowane rosnąco po priceMax"""
+    
+    def __init__(self, items: list):
+        ordered = sorted(items, key=lambda item: parse_price(item.get('priceMax')))
+        self._groups = {None: ordered}
+        for item in ordered:
+            self._groups.setdefault(catalog_item_type(item), []).append(item)
+        self._prices = {
+            key: [parse_price(item.get('priceMax')) for item in group]
+            for key, group in self._groups.items()
+        }
+    
+    @property
+    def types(self) -> List[str]:
+        """Typy produktów obecne w katalogu"""
+        return [key for key in self._groups if key is not None]
+    
+    def query(self, product_type: Optional[str] = None, max_price: Optional[float] = None, top: Optional[int] = None) -> list:
+        """
+        Produkty spełniające kryteria, od najtańszego.
+        
+        Args:
+            product_type: Typ produktu (MOBILE, INTERNET, TV) - opcjonalnie
+            max_price: Najwyższa akceptowana cena priceMax - opcjonalnie
+            top: Ile najtańszych produktów zwrócić - opcjonalnie
+            
+        Returns:
+            Lista produktów (pusta, gdy nic nie pasuje)
+        """
+        key = product_type.upper() if product_type else None
+        items = self._groups.get(key, [])
+        if max_price is not None:
+            items = items[:bisect_right(self._prices.get(key, []), max_price)]
+        if top is not None:
+            items = items[:top]
+        return items
+
+
+class CatalogSnapshot:
+    """Pobrany katalog produktów razem z zapamiętanym sformatowanym tekstem"""
+    
+    def __init__(self, catalog_data):
+        if isinstance(catalog_data, dict) and "error" in catalog_data:
+            self.error = catalog_data["error"]
+            self.items = []
+        else:
+            self.error = None
+            self.items = catalog_data or []
+        self._texts = {}
+        self._version = None
+        self._index = None
+    
+    @property
+    def text(self) -> str:
+        """Sformatowany katalog w czytelnej formie"""
+        return self.render()
+    
+    @property
+    def index(self) -> CatalogIndex:
+        """Indeks produktów budowany raz na wersję katalogu"""
+        if self._index is None:
+            self._index = CatalogIndex(self.items)
+        return self._index
+    
+    def render(
+        self,
+        compact: bool = False,
+        product_type: Optional[str] = None,
+        max_price: Optional[float] = None,
+        top: Optional[int] = None
+    ) -> str:
+        """Sformatowany (opcjonalnie przefiltrowany) katalog - każde zapytanie formatowane raz na wersję"""
+        product_type = product_type.upper() if product_type else None
+        key = (compact, product_type, max_price, top)
+        text = self._texts.get(key)
+        if text is not None:
+            return text
+        
+        if product_type is None and max_price is None and top is None:
+            text = format_catalog(self.items, compact=compact)
+        else:
+            filters = {
+                "type": product_type,
+                "max_price": f"{max_price:g}" if max_price is not None else None,
+                "top": top,
+            }
+            items = self.index.query(product_type, max_price, top)
+            if items:
+                text = format_catalog(items, compact=compact, filters=filters)
+            else:
+                criteria = ", ".join(f"{name}={value}" for name, value in filters.items() if value is not None)
+                text = (
+                    f"❌ Brak produktów spełniających kryteria ({criteria}). "
+                    f"Dostępne typy: {', '.join(self.index.types) or 'brak'}"
+                )
+        
+        # Liczba różnych zapytań jest nieograniczona (max_price) - pamiętamy tylko pierwsze
+        if len(self._texts) < CATALOG_QUERY_CACHE_SIZE:
+            self._texts[key] = text
+        return text
+    
+    @property
+    def version(self) -> str:
+        """Skrót zawartości katalogu - zmienia się tylko gdy zmieni się katalog"""
+        if self._version is None:
+            raw = json.dumps(self.items, sort_keys=True, ensure_ascii=False, default=str)
+            self._version = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+        return self._version
+
+
+catalog_cache = StaleWhileRevalidateCache(
+    ttl=CATALOG_CACHE_TTL,
+    stale_ttl=CATALOG_CACHE_STALE_TTL,
+    should_cache=lambda snapshot: snapshot.error is None
+)
+
+
+async def load_catalog(product_type: Optional[str] = None) -> CatalogSnapshot:
+    """Zwraca katalog z cache (wspólnego dla całego procesu), w razie potrzeby pobiera go z backendu"""
+    key = product_type.upper() if product_type else None
+    
+    async def fetch() -> CatalogSnapshot:
+        params = {"type": key} if key else {}
+        return CatalogSnapshot(await call_java_backend("component-catalog", params=params))
+    
+    return await catalog_cache.get(key, fetch)
+
+
+def catalog_version() -> str:
+    """Łączna wersja katalogów w cache - zmienia się, gdy zmieni się którykolwiek z nich"""
+    parts = [
+        f"{key}={catalog_cache.peek(key).version}"
+        for key in sorted(catalog_cache.keys(), key=str)
+    ]
+    return hashlib.sha1(";".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+# --- Tool implementations (shared by the MCP tools and ToolExecutor) ---
+
+async def run_check_customer(pesel: str, compact: bool = False) -> str:
+    """Dane klienta po numerze PESEL (compact: zwięzły format key=value dla modelu)"""
+    customer_data = await fetch_customer(pesel)
+    return format_customer_info(customer_data, compact=compact)
+
+
+async def run_get_product_catalog(
+    product_type: Optional[str] = None,
+    max_price: Optional[float] = None,
+    top: Optional[int] = None,
+    compact: bool = False
+) -> str:
+    """Katalog produktów, opcjonalnie przefiltrowany (compact: zwięzły format key=value dla modelu)"""
+    snapshot = await load_catalog()
+    
+    if snapshot.error:
+        return f"❌ Błąd pobierania katalogu: {snapshot.error}"
+    
+    return snapshot.render(compact, product_type, max_price, top)
+
+
+async def run_create_order(customer_id: int, component_catalog_ids: List[int], compact: bool = False) -> str:
+    """Tworzy zamówienie (compact: zwięzły format key=value dla modelu)"""
+    order_data = {
+        "customerId": customer_id,
+        "componentCatalogIds": component_catalog_ids
+    }
+    
+    result = await call_java_backend("order", method="POST", data=order_data)
+    
+    # Zamówienie zmienia usługi (i faktury) klienta - nie serwuj ich z cache.
+    # Czyścimy też po błędzie: np. timeout nie oznacza, że zamówienie nie powstało.
+    invalidate_customer(customer_id)
     
-    return info
+    return format_order_response(result, compact=compact)
+
+
+async def run_check_invoices_by_pesel(pesel: str, compact: bool = False) -> str:
+    """Klient i jego faktury po numerze PESEL (compact: zwięzły format key=value dla modelu)"""
+    # Krok 1: Pobierz dane klienta
+    customer_data = await fetch_customer(pesel)
+    
+    if customer_data.get("status_code") == 404:
+        return f"❌ Nie znaleziono klienta o numerze PESEL: {pesel}"
+    
+    if "error" in customer_data:
+        return f"❌ Błąd pobierania danych klienta: {customer_data['error']}"
+    
+    customer_id = customer_data.get('id')
+    if not customer_id:
+        return "❌ Błąd: Nie udało się pobrać ID klienta"
+    
+    customer_name = f"{customer_data.get('firstName', '')} {customer_data.get('lastName', '')}".strip()
+    
+    # Krok 2: Pobierz faktury
+    invoices_data = await fetch_invoices(customer_id)
+    
+    invoices_info = format_invoices(invoices_data, compact=compact)
+    
+    if compact:
+        return format_compact(customer_id=customer_id, name=customer_name, pesel=pesel) + "\n" + invoices_info
+    
+    # Header z danymi klienta
+    header = f"""
+👤 Klient: {customer_name}
+🆔 PESEL: {pesel}
+🔑 ID: {customer_id}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+"""
+    
+    return header + invoices_info
+
+
+async def run_check_invoices(customer_id: int, compact: bool = False) -> str:
+    """Faktury klienta (compact: zwięzły format key=value dla modelu)"""
+    invoices_data = await fetch_invoices(customer_id)
+    return format_invoices(invoices_data, compact=compact)
 
 
 # --- MCP Tools (exposed functions) ---
@@ -272,31 +792,30 @@ async def check_customer(pesel: str) -> str:
     Returns:
         Sformatowane informacje o kliencie i jego usługach (zawiera ID klienta potrzebne do zamówienia)
     """
-    customer_data = await call_java_backend("customer", params={"pesel": pesel})
-    return format_customer_info(customer_data)
+    return await run_check_customer(pesel)
 
 
 @mcp.tool()
-async def get_product_catalog(product_type: Optional[str] = None) -> str:
+async def get_product_catalog(
+    product_type: Optional[str] = None,
+    max_price: Optional[float] = None,
+    top: Optional[int] = None
+) -> str:
     """
     Pobiera katalog dostępnych produktów Play.
     
+    Filtry są wykonywane na indeksie pełnego katalogu z cache (jedno
+    zapytanie do backendu na wersję katalogu, niezależnie od filtrów).
+    
     Args:
         product_type: Typ produktu do filtrowania (MOBILE, INTERNET, TV) - opcjonalnie
+        max_price: Maksymalna cena miesięczna (priceMax) w PLN - opcjonalnie
+        top: Liczba najtańszych produktów do zwrócenia - opcjonalnie
     
     Returns:
         Sformatowany katalog produktów z cenami i szczegółami (zawiera ID produktów)
     """
-    params = {}
-    if product_type:
-        params["type"] = product_type.upper()
-    
-    catalog_data = await call_java_backend("component-catalog", params=params)
-    
-    if isinstance(catalog_data, dict) and "error" in catalog_data:
-        return f"❌ Błąd pobierania katalogu: {catalog_data['error']}"
-    
-    return format_catalog(catalog_data)
+    return await run_get_product_catalog(product_type, max_price, top)
 
 
 @mcp.tool()
@@ -315,13 +834,7 @@ async def create_order(customer_id: int, component_catalog_ids: List[int]) -> st
         customer_id=123, component_catalog_ids=[5, 12] 
         tworzy zamówienie na produkty o ID 5 i 12 dla klienta 123
     """
-    order_data = {
-        "customerId": customer_id,
-        "componentCatalogIds": component_catalog_ids
-    }
-    
-    result = await call_java_backend("order", method="POST", data=order_data)
-    return format_order_response(result)
+    return await run_create_order(customer_id, component_catalog_ids)
 
 
 @mcp.tool()
@@ -338,35 +851,7 @@ async def check_invoices_by_pesel(pesel: str) -> str:
     Example:
         pesel="12345678901" - automatycznie znajdzie klienta i pokaże jego faktury
     """
-    # Krok 1: Pobierz dane klienta
-    customer_data = await call_java_backend("customer", params={"pesel": pesel})
-    
-    if "error" in customer_data:
-        return f"❌ Nie znaleziono klienta o numerze PESEL: {pesel}\n{customer_data['error']}"
-    
-    if customer_data.get("status_code") == 404:
-        return f"❌ Nie znaleziono klienta o numerze PESEL: {pesel}"
-    
-    customer_id = customer_data.get('id')
-    if not customer_id:
-        return "❌ Błąd: Nie udało się pobrać ID klienta"
-    
-    customer_name = f"{customer_data.get('firstName', '')} {customer_data.get('lastName', '')}".strip()
-    
-    # Krok 2: Pobierz faktury
-    invoices_data = await call_java_backend("invoices", params={"customerId": customer_id})
-    
-    # Header z danymi klienta
-    header = f"""
-👤 Klient: {customer_name}
-🆔 PESEL: {pesel}
-🔑 ID: {customer_id}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-"""
-    
-    invoices_info = format_invoices(invoices_data)
-    
-    return header + invoices_info
+    return await run_check_invoices_by_pesel(pesel)
 
 
 @mcp.tool()
@@ -383,5 +868,4 @@ async def check_invoices(customer_id: int) -> str:
     Example:
         customer_id=123 - sprawdza wszystkie faktury klienta o ID 123
     """
-    invoices_data = await call_java_backend("invoices", params={"customerId": customer_id})
-    return format_invoices(invoices_data)
\ No newline at end of file
+    return await run_check_invoices(customer_id)
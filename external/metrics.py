@@ -0,0 +1,289 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Metrics are plain counters kept per process (every uvicorn worker exposes
+its own); a TurnTimer in a ContextVar follows one user turn through the
+model connector, the tool executor and the backend client, so tasks
+spawned by the turn add their time to the same turn.
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """Base class: a named metric with optional label names."""
+    
+    kind = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        """Add amount to the series selected by labels."""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram."""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Seria: [liczniki kubełków..., suma, liczba obserwacji]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+    
+    def observe(self, value: float, **labels):
+        """Record one observation."""
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            plain = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{plain} {series[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time."""
+    
+    kind = "gauge"
+    
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._read = read
+    
+    def render(self) -> List[str]:
+        try:
+            value = self._read()
+        except Exception:
+            return []
+        return super().render() + [f"{self.name} {_format_value(value)}"]
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics ---
+
+TURNS = Counter("chat_turns_total", "User turns by outcome", ("outcome",))
+TURN_DURATION = Histogram("chat_turn_duration_seconds", "Total turn latency", ("outcome",))
+TURN_TTFT = Histogram("chat_turn_time_to_first_token_seconds", "Time from user message to first chunk sent to the client")
+TURN_LLM_CALLS = Histogram("chat_turn_llm_calls", "LLM round trips per turn", buckets=COUNT_BUCKETS)
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Wait for an LLM scheduler slot")
+LLM_CALL_DURATION = Histogram("llm_call_duration_seconds", "Duration of one streamed LLM call")
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens by kind", ("kind",))
+TOOL_DURATION = Histogram("tool_duration_seconds", "Tool execution time", ("tool",))
+BACKEND_DURATION = Histogram("backend_request_duration_seconds", "Sales backend request latency", ("endpoint", "method"))
+BACKEND_REQUESTS = Counter("backend_requests_total", "Sales backend requests by outcome", ("endpoint", "method", "outcome"))
+
+
+# --- Per-turn timing ---
+
+class TurnTimer:
+    """Where the milliseconds of one turn go (queue, LLM, tools, backend)."""
+    
+    __slots__ = (
+        "started", "first_token", "llm_calls", "queue_wait",
+        "llm_seconds", "tool_seconds", "backend_seconds", "backend_calls"
+    )
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.llm_calls = 0
+        self.queue_wait = 0.0
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.backend_seconds = 0.0
+        self.backend_calls = 0
+    
+    def mark_first_token(self):
+        """Record the first chunk sent to the client (later calls are ignored)."""
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.started
+            TURN_TTFT.observe(self.first_token)
+    
+    def wrap(self, stream_callback: Optional[Callable]) -> Optional[Callable]:
+        """Wrap a stream callback so the first chunk marks the time to first token."""
+        if stream_callback is None:
+            return None
+        
+        async def timed(chunk: str):
+            self.mark_first_token()
+            await stream_callback(chunk)
+        
+        return timed
+    
+    def finish(self, outcome: str) -> dict:
+        """
+        Close the turn and record its histograms.
+        
+        Args:
+            outcome: "ok", "busy", "cancelled" or "error"
+            
+        Returns:
+            Timing breakdown in milliseconds (for the turn log)
+        """
+        duration = time.perf_counter() - self.started
+        TURNS.inc(outcome=outcome)
+        TURN_DURATION.observe(duration, outcome=outcome)
+        if self.llm_calls:
+            TURN_LLM_CALLS.observe(self.llm_calls)
+        return {
+            "total_ms": round(duration * 1000, 1),
+            "first_token_ms": round(self.first_token * 1000, 1) if self.first_token is not None else None,
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "llm_ms": round(self.llm_seconds * 1000, 1),
+            "tools_ms": round(self.tool_seconds * 1000, 1),
+            "backend_ms": round(self.backend_seconds * 1000, 1),
+            "llm_calls": self.llm_calls,
+            "backend_calls": self.backend_calls,
+        }
+
+
+_current_turn: ContextVar[Optional[TurnTimer]] = ContextVar("current_turn", default=None)
+
+
+def start_turn() -> TurnTimer:
+    """Start timing a turn in the current task (child tasks inherit it)."""
+    timer = TurnTimer()
+    _current_turn.set(timer)
+    return timer
+
+
+def current_turn() -> Optional[TurnTimer]:
+    """The turn being timed in this context, if any."""
+    return _current_turn.get()
+
+
+def observe_queue_wait(seconds: float):
+    """Record the wait for an LLM slot."""
+    LLM_QUEUE_WAIT.observe(seconds)
+    timer = _current_turn.get()
+    if timer is not None:
+        timer.queue_wait += seconds
+
+
+def observe_llm_call(seconds: float):
+    """Record one streamed LLM call."""
+    LLM_CALL_DURATION.observe(seconds)
+    timer = _current_turn.get()
+    if timer is not None:
+        timer.llm_calls += 1
+        timer.llm_seconds += seconds
+
+
+def observe_tokens(usage: dict):
+    """Record token usage of one LLM call."""
+    for kind in ("input_tokens", "cached_input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], kind=kind[:-len("_tokens")])
+
+
+def observe_tools(seconds: float):
+    """Record the wall time of one tool batch of the current turn."""
+    timer = _current_turn.get()
+    if timer is not None:
+        timer.tool_seconds += seconds
+
+
+def observe_tool(tool: str, seconds: float):
+    """Record the execution time of a single tool."""
+    TOOL_DURATION.observe(seconds, tool=tool)
+
+
+def observe_backend(endpoint: str, method: str, seconds: float, outcome: str):
+    """
+    Record one sales backend request.
+    
+    Args:
+        endpoint: Backend endpoint (e.g. "customer")
+        method: HTTP method
+        seconds: Request duration
+        outcome: "ok", "not_found", "error" or "circuit_open"
+    """
+    BACKEND_DURATION.observe(seconds, endpoint=endpoint, method=method)
+    BACKEND_REQUESTS.inc(endpoint=endpoint, method=method, outcome=outcome)
+    timer = _current_turn.get()
+    if timer is not None:
+        timer.backend_seconds += seconds
+        timer.backend_calls += 1
@@ -3,50 +3,236 @@ Main model connector for Play virtual consultant.
 """
 
 import os
-from typing import Optional, Callable
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import time
+import asyncio
+from typing import Optional, Callable, List, Tuple
+from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langchain_core.output_parsers import StrOutputParser
 
-from .prompts import SYSTEM_PROMPT, TOOL_PROCESSING_PROMPT
+from .prompts import SYSTEM_PROMPT, TOOL_PROCESSING_PROMPT, NATIVE_TOOLS_PROMPT
+from .llm import get_llm, last_usage, record_usage, reset_usage
 from .tool_executor import ToolExecutor
+from .stream_filter import ToolMarkerFilter
+from .history import ConversationHistory
+from .scheduler import SchedulerBusyError, llm_scheduler
+from .prefetch import start_prefetch
+from .answer_cache import ANSWER_CACHE, answer_cache
+from .metrics import observe_llm_call, observe_queue_wait, observe_tokens, observe_tools, start_turn
+
+# Tryb streamowania do klienta: "incremental" (na bieżąco) lub "buffered" (po całej odpowiedzi)
+STREAM_MODE = os.environ.get("STREAM_MODE", "incremental").lower()
+
+# Wywoływanie narzędzi: "markers" (komendy [..] w tekście) lub "native" (function calling)
+TOOL_CALLING_MODE = os.environ.get("TOOL_CALLING_MODE", "markers").lower()
+
+
+def default_system_prompt(tool_calling_mode: str = TOOL_CALLING_MODE) -> str:
+    """Get the system prompt for a tool calling mode."""
+    if tool_calling_mode == "native":
+        return SYSTEM_PROMPT + NATIVE_TOOLS_PROMPT
+    return SYSTEM_PROMPT
+
+
+class Generation:
+    """Result of a single model call."""
+    
+    __slots__ = ("text", "held_chunks", "markers", "tool_calls")
+    
+    def __init__(self, text: str, held_chunks: List[str], markers: List[str], tool_calls: List[dict]):
+        self.text = text
+        self.held_chunks = held_chunks
+        self.markers = markers
+        self.tool_calls = tool_calls
 
 
 class ModelConnector:
     """
     Connects to the AI model and manages conversation history.
     Supports MCP tool execution and streaming responses.
+    
+    The LLM client, output parser and tool executor are process-wide;
+    an instance only holds per-session state (history and settings).
     """
     
-    def __init__(self, system_prompt: str = SYSTEM_PROMPT):
+    # Wspólne dla wszystkich sesji (bezstanowe)
+    parser = StrOutputParser()
+    tool_executor = ToolExecutor()
+    # Modele z podpiętymi narzędziami: id(llm) -> (llm, bound)
+    _tool_llms: dict = {}
+    
+    def __init__(
+        self,
+        system_prompt: Optional[str] = None,
+        llm=None,
+        session_id: str = "",
+        tool_calling_mode: str = TOOL_CALLING_MODE
+    ):
         """
         Initialize the model connector.
         
         Args:
-            system_prompt: System prompt for the AI model
-        """
-        self.llm = ChatOpenAI(
-            base_url="https://api.scaleway.ai/2d6e7638-f7f5-41f4-b61c-79209c1785be/v1",
-            api_key=os.environ.get("SCW_SECRET_KEY"),
-            model="gpt-oss-120b",
-            max_tokens=2048,
-            temperature=1,
-            top_p=1,
-            presence_penalty=0,
-            streaming=True
-        )
-        
-        self.parser = StrOutputParser()
-        self.conversation_history = [SystemMessage(content=system_prompt)]
-        self.tool_executor = ToolExecutor()
+            system_prompt: System prompt for the AI model (defaults to the
+                prompt matching the tool calling mode)
+            llm: Optional chat model (defaults to the shared client)
+            session_id: Session identifier (fairness key for the LLM scheduler)
+            tool_calling_mode: "markers" or "native"
+        """
+        self._llm = llm
+        self.session_id = session_id
+        self.scheduler = llm_scheduler
+        self.answer_cache = answer_cache if ANSWER_CACHE else None
+        self.tool_calling_mode = tool_calling_mode
+        self.history = ConversationHistory(system_prompt or default_system_prompt(tool_calling_mode))
         self.max_tool_iterations = 3  # Maksymalnie 3 iteracje narzędzi
+        self.max_tool_concurrency = ToolExecutor.MAX_CONCURRENCY  # Limit równoległych narzędzi w turze
+        self.incremental_streaming = STREAM_MODE == "incremental"
+        self.cancelled_turns = 0
+        # Wersja stanu sesji - rośnie z każdą turą (magazyn sesji nie nadpisuje nowszej wersji starszą)
+        self.state_version = 0
+        self._turn_committed = False
+        # Zużycie tokenów (wejście z cache dostawcy liczone osobno)
+        self.usage = self._empty_usage()
+        self.last_turn_usage = self._empty_usage()
+        self.last_turn_tools: List[str] = []
+        self.last_turn_timing: dict = {}
+        self._prefetch = None
+    
+    @property
+    def llm(self):
+        """Chat model used by this session (the shared client unless overridden)."""
+        return self._llm or get_llm()
+    
+    @property
+    def tool_llm(self):
+        """The session's chat model with the native tools bound (cached per model)."""
+        llm = self.llm
+        cached = self._tool_llms.get(id(llm))
+        if cached is None or cached[0] is not llm:
+            cached = (llm, llm.bind_tools(ToolExecutor.TOOL_SCHEMAS, parallel_tool_calls=True))
+            self._tool_llms[id(llm)] = cached
+        return cached[1]
+    
+    @staticmethod
+    def _empty_usage() -> dict:
+        return {"llm_calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+    
+    def _record_usage(self, usage_metadata: Optional[dict]):
+        """
+        Account the tokens of the last model call.
+        
+        Raw OpenAI usage (with prompt_tokens_details.cached_tokens) is
+        preferred; LangChain usage_metadata is the fallback.
+        
+        Args:
+            usage_metadata: usage_metadata of the last streamed chunk, if any
+        """
+        raw = last_usage()
+        if raw:
+            details = raw.get("prompt_tokens_details") or {}
+            call = {
+                "input_tokens": raw.get("prompt_tokens") or 0,
+                "cached_input_tokens": details.get("cached_tokens") or 0,
+                "output_tokens": raw.get("completion_tokens") or 0,
+            }
+        elif usage_metadata:
+            details = usage_metadata.get("input_token_details") or {}
+            call = {
+                "input_tokens": usage_metadata.get("input_tokens", 0),
+                "cached_input_tokens": details.get("cache_read") or 0,
+                "output_tokens": usage_metadata.get("output_tokens", 0),
+            }
+        else:
+            call = {}
+        call["llm_calls"] = 1
+        
+        for usage in (self.usage, self.last_turn_usage):
+            for key in usage:
+                usage[key] += call.get(key, 0)
+        record_usage(call)
+        observe_tokens(call)
+    
+    async def _generate(
+        self,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        admission: bool = True,
+        tools: bool = False
+    ) -> Generation:
+        """
+        Run a single model generation over the current history.
+        
+        The output goes through a ToolMarkerFilter exactly once: it hides
+        text markers from the client and collects them as commands. In
+        incremental mode visible text is forwarded as soon as it is known;
+        in buffered mode it is held back so the caller can replay it.
+        
+        Args:
+            stream_callback: Optional callback for streaming to CLIENT
+            admission: True for the first call of a turn (may be rejected
+                by the scheduler), False for tool follow-ups
+            tools: Offer the native function tools to the model
+            
+        Returns:
+            Generation with the text, held back chunks, markers and tool calls
+            
+        Raises:
+            SchedulerBusyError: When the scheduler cannot admit a new turn
+        """
+        output_parts = []
+        held_chunks = []
+        marker_filter = ToolMarkerFilter()
+        stream_now = self.incremental_streaming and stream_callback
+        llm = self.tool_llm if tools else self.llm
+        
+        async def emit(visible: str):
+            if not visible:
+                return
+            if stream_now:
+                await stream_callback(visible)
+            else:
+                held_chunks.append(visible)
+        
+        # Keep the prompt under the token budget before every call
+        self.history.fit_to_budget()
+        
+        usage_metadata = None
+        message = None
+        waiting = time.perf_counter()
+        async with self.scheduler.slot(self.session_id, admission=admission):
+            started = time.perf_counter()
+            observe_queue_wait(started - waiting)
+            reset_usage()
+            async for chunk in llm.astream(self.history.messages):
+                if chunk.usage_metadata:
+                    usage_metadata = chunk.usage_metadata
+                if tools:
+                    # Argumenty wywołań funkcji przychodzą w kawałkach - składamy całość
+                    message = chunk if message is None else message + chunk
+                if not chunk.content:
+                    continue
+                
+                output_parts.append(chunk.content)
+                await emit(marker_filter.feed(chunk.content))
+        
+        observe_llm_call(time.perf_counter() - started)
+        self._record_usage(usage_metadata)
+        await emit(marker_filter.flush())
+        
+        tool_calls = list(message.tool_calls) if message is not None else []
+        return Generation(''.join(output_parts), held_chunks, marker_filter.markers, tool_calls)
+    
+    async def _replay(self, generation: Generation, stream_callback: Optional[Callable[[str], None]]):
+        """Send the chunks held back in buffered mode to the client."""
+        if stream_callback:
+            for chunk in generation.held_chunks:
+                await stream_callback(chunk)
     
     async def _process_response_with_tools(
         self, 
         text: str, 
         stream_callback: Optional[Callable[[str], None]] = None,
         internal_callback: Optional[Callable[[str], None]] = None,
-        iteration: int = 0
+        iteration: int = 0,
+        commands: Optional[List[str]] = None
     ) -> str:
         """
         Process AI response and execute any tool commands found.
@@ -56,6 +242,7 @@ class ModelConnector:
             stream_callback: Optional callback for streaming to CLIENT
             internal_callback: Optional callback for internal logging only
             iteration: Current iteration count (prevents infinite loops)
+            commands: Tool commands already found in text (scanned if None)
             
         Returns:
             Final processed response text
@@ -66,66 +253,109 @@ class ModelConnector:
                 await internal_callback(f"⚠️ LIMIT ITERACJI ({self.max_tool_iterations}) - przerywam wykonywanie narzędzi\n")
             return text
         
-        # Find tool commands
-        tool_results = []
-        commands = self.tool_executor.find_tool_commands(text)
+        if commands is None:
+            commands = self.tool_executor.find_tool_commands(text)
         
         if not commands:
             return text
         
-        # Execute tools and collect results (DON'T stream to client)
-        for command in commands:
-            # Log internally but don't send to client
-            if internal_callback:
-                await internal_callback(f"\n🔧 Wykonuję: {command} (iteracja {iteration + 1}/{self.max_tool_iterations})\n")
-            
-            result = await self.tool_executor.execute_command(command)
-            tool_results.append((command, result))
-            
-            # Log result internally
-            if internal_callback:
-                await internal_callback(f"✅ Otrzymano wynik ({len(result)} znaków)\n")
+        # Execute tools concurrently and collect results (DON'T stream to client)
+        if internal_callback:
+            await internal_callback(f"\n🔧 Wykonuję {len(commands)} narzędzi (iteracja {iteration + 1}/{self.max_tool_iterations})\n")
         
-        # Format results and create follow-up prompt
-        tool_results_text = self.tool_executor.format_tool_results(tool_results)
-        follow_up_prompt = TOOL_PROCESSING_PROMPT.format(
-            tool_results=tool_results_text
-        )
+        tool_results = await self._execute_tools(commands, internal_callback, self._append_tool_results)
         
-        # Add to history and get final response
-        self.conversation_history.append(HumanMessage(content=follow_up_prompt))
+        # Add results to history and get final response
+        self._append_tool_results(tool_results)
         
-        # Get response from LLM - DON'T stream to client yet (we might need to process more tools)
-        final_response = ''
-        temp_chunks = []
-        async for chunk in self.llm.astream(self.conversation_history):
-            if chunk.content:
-                final_response += chunk.content
-                temp_chunks.append(chunk.content)
+        # Get response from LLM - in buffered mode DON'T stream to client yet (we might need to process more tools)
+        generation = await self._generate(stream_callback, admission=False)
         
         # Check if new response also contains tools (recursive)
-        new_tools = self.tool_executor.find_tool_commands(final_response)
+        new_tools = generation.markers
         if new_tools and iteration + 1 < self.max_tool_iterations:
             if internal_callback:
                 await internal_callback(f"\n⚠️ Wykryto kolejne narzędzia w odpowiedzi: {new_tools}\n")
             
             # Add current response to history
-            self.conversation_history.append(AIMessage(content=final_response))
+            self.history.append(AIMessage(content=generation.text))
             
-            # Process recursively - DON'T stream yet!
+            # Process recursively
             return await self._process_response_with_tools(
-                final_response,
+                generation.text,
                 stream_callback,
                 internal_callback,
-                iteration + 1
+                iteration + 1,
+                commands=new_tools
             )
         else:
-            # No more tools - NOW stream the final response to client
-            if stream_callback:
-                for chunk in temp_chunks:
-                    await stream_callback(chunk)
+            # No more tools - NOW stream the buffered final response to client
+            await self._replay(generation, stream_callback)
+            return generation.text
+    
+    async def _execute_tools(
+        self,
+        commands: List[str],
+        internal_callback: Optional[Callable[[str], None]],
+        record: Callable[[List[Tuple[str, str]]], None]
+    ) -> List[Tuple[str, str]]:
+        """
+        Execute tool commands, honouring cancellation of the turn.
+        
+        Read-only batches are cancelled together with the turn. A batch with
+        a write command (CREATE_ORDER) always runs to completion and its
+        results are recorded in the history before the cancellation goes on,
+        so the model never forgets an order that was actually placed.
+        
+        Args:
+            commands: Tool command strings
+            internal_callback: Optional callback for internal logging only
+            record: Adds the results to history (used on cancellation)
+            
+        Returns:
+            List of (command, result) tuples
+        """
+        self.last_turn_tools.extend(commands)
+        started = time.perf_counter()
+        execution = asyncio.ensure_future(self.tool_executor.execute_commands(
+            commands,
+            callback=internal_callback,
+            max_concurrency=self.max_tool_concurrency,
+            prefetch=self._prefetch
+        ))
+        has_write = any(self.tool_executor.is_write_command(cmd) for cmd in commands)
+        try:
+            if not has_write:
+                return await execution
             
-            return final_response
+            try:
+                return await asyncio.shield(execution)
+            except asyncio.CancelledError:
+                record(await execution)
+                self._turn_committed = True
+                raise
+        finally:
+            observe_tools(time.perf_counter() - started)
+            if has_write and self._prefetch:
+                # Wyniki z prefetchu pochodzą sprzed zapisu - kolejne iteracje pytają backend
+                self._prefetch.finish()
+                self._prefetch = None
+    
+    def _append_tool_results(self, tool_results: List[Tuple[str, str]]):
+        """Format tool results as the follow-up prompt and add it to history."""
+        tool_results_text = self.tool_executor.format_tool_results(tool_results)
+        follow_up_prompt = TOOL_PROCESSING_PROMPT.format(
+            tool_results=tool_results_text
+        )
+        self.history.append(HumanMessage(content=follow_up_prompt))
+    
+    def _append_tool_messages(self, tool_calls: List[dict], tool_results: List[Tuple[str, str]]):
+        """Add one ToolMessage per native tool call (same order as the calls)."""
+        for call, result in zip(tool_calls, tool_results):
+            self.history.append(ToolMessage(
+                content=self.tool_executor.format_tool_results([result]),
+                tool_call_id=call["id"]
+            ))
     
     async def get_model_response(
         self, 
@@ -143,24 +373,120 @@ class ModelConnector:
         
         Returns:
             Complete response text
+            
+        Raises:
+            SchedulerBusyError: When the model is overloaded (history is left unchanged)
+            asyncio.CancelledError: When the turn is cancelled (the turn is
+                rolled back unless it already placed an order)
         """
+        # Cache tylko dla ogólnych pytań na początku rozmowy (bez kontekstu klienta)
+        cacheable = (
+            self.answer_cache is not None
+            and self.history.counts["user"] == 0
+            and self.answer_cache.is_generic(input_text)
+        )
+        
         # Add user message to history
-        self.conversation_history.append(HumanMessage(content=input_text))
+        user_message = HumanMessage(content=input_text)
+        self.history.append(user_message)
+        self._turn_committed = False
+        self.last_turn_usage = self._empty_usage()
+        self.last_turn_tools = []
+        # Pomiar tury - zadania potomne (narzędzia, prefetch) dziedziczą timer
+        timer = start_turn()
+        stream_callback = timer.wrap(stream_callback)
+        outcome = "error"
         
-        # Get initial response from model - DON'T stream yet (might contain tools)
-        output_text = ''
-        temp_chunks = []
-        async for chunk in self.llm.astream(self.conversation_history):
-            if chunk.content:
-                output_text += chunk.content
-                temp_chunks.append(chunk.content)
+        # PESEL w wiadomości - sprawdzanie klienta rusza równolegle z pierwszym wywołaniem modelu
+        self._prefetch = start_prefetch(input_text, self.tool_executor.execute_command)
+        if self._prefetch and internal_callback:
+            await internal_callback(f"⚡ Prefetch: {self._prefetch.commands}\n")
+        
+        respond = self._respond_native if self.tool_calling_mode == "native" else self._respond
+        try:
+            if cacheable:
+                response = await self._respond_cached(respond, user_message, stream_callback, internal_callback)
+            else:
+                response = await respond(stream_callback, internal_callback)
+            outcome = "ok"
+            return response
+        except SchedulerBusyError:
+            # Tura nie została przyjęta - klient może ją po prostu powtórzyć
+            outcome = "busy"
+            self.history.rollback_to(user_message)
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            self.cancelled_turns += 1
+            if not self._turn_committed:
+                self.history.rollback_to(user_message)
+            raise
+        finally:
+            if self._prefetch:
+                self._prefetch.finish()
+                self._prefetch = None
+            self.state_version += 1
+            self.last_turn_timing = timer.finish(outcome)
+    
+    async def _respond_cached(
+        self,
+        respond: Callable,
+        user_message: HumanMessage,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        internal_callback: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Answer a generic question from the answer cache, or answer it and cache the turn.
         
-        # Check if response contains tool commands
-        tools_found = self.tool_executor.find_tool_commands(output_text)
+        A hit replays the cached chunks through stream_callback and appends
+        the cached history messages, as if the turn had run.
+        """
+        input_text = user_message.content
+        cached = self.answer_cache.get(self.answer_cache.key(input_text, self.tool_calling_mode))
+        if cached is not None:
+            if internal_callback:
+                await internal_callback("💾 Odpowiedź z cache\n")
+            if stream_callback:
+                for chunk in cached.chunks:
+                    await stream_callback(chunk)
+            for message in self.answer_cache.messages(cached):
+                self.history.append(message)
+            return cached.text
+        
+        chunks = []
+        
+        async def record(chunk: str):
+            chunks.append(chunk)
+            if stream_callback:
+                await stream_callback(chunk)
+        
+        text = await respond(record, internal_callback)
+        # Klucz liczony po turze - katalog mógł zostać właśnie pobrany
+        self.answer_cache.put(
+            self.answer_cache.key(input_text, self.tool_calling_mode),
+            text,
+            chunks,
+            self.history.messages_since(user_message),
+            self.last_turn_tools
+        )
+        return text
+    
+    async def _respond(
+        self,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        internal_callback: Optional[Callable[[str], None]] = None,
+        generation: Optional[Generation] = None
+    ) -> str:
+        """Generate the answer using text tool markers."""
+        # Get initial response from model - tool markers are never streamed to client
+        if generation is None:
+            generation = await self._generate(stream_callback)
+        
+        tools_found = generation.markers
         
         if tools_found:
             # Add initial AI response to history
-            self.conversation_history.append(AIMessage(content=output_text))
+            self.history.append(AIMessage(content=generation.text))
             
             # Log tool detection internally
             if internal_callback:
@@ -169,31 +495,84 @@ class ModelConnector:
             # Execute tools and get final response (with iteration limit)
             # This will handle all recursive tool calls
             final_text = await self._process_response_with_tools(
-                output_text, 
+                generation.text, 
                 stream_callback,
                 internal_callback,
-                iteration=0  # Start from 0
+                iteration=0,  # Start from 0
+                commands=tools_found
             )
             
             # Add final response to history
-            self.conversation_history.append(AIMessage(content=final_text))
+            self.history.append(AIMessage(content=final_text))
             
             return final_text
         else:
-            # No tools needed, stream to client NOW
-            if stream_callback:
-                for chunk in temp_chunks:
-                    await stream_callback(chunk)
+            # No tools needed, stream buffered chunks to client NOW
+            await self._replay(generation, stream_callback)
             
             # Add response to history
-            self.conversation_history.append(AIMessage(content=output_text))
-            return output_text
+            self.history.append(AIMessage(content=generation.text))
+            return generation.text
+    
+    async def _respond_native(
+        self,
+        stream_callback: Optional[Callable[[str], None]] = None,
+        internal_callback: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Generate the answer using native (parallel) function calls.
+        
+        All calls of one assistant message run as one batch, so independent
+        lookups cost a single extra generation. A response with text markers
+        instead of calls falls back to the marker flow.
+        """
+        generation = await self._generate(stream_callback, tools=True)
+        iteration = 0
+        
+        while generation.tool_calls:
+            if iteration >= self.max_tool_iterations:
+                if internal_callback:
+                    await internal_callback(f"⚠️ LIMIT ITERACJI ({self.max_tool_iterations}) - przerywam wykonywanie narzędzi\n")
+                break
+            
+            tool_calls = generation.tool_calls
+            commands = [
+                self.tool_executor.tool_call_to_command(call["name"], call["args"])
+                for call in tool_calls
+            ]
+            self.history.append(AIMessage(content=generation.text, tool_calls=tool_calls))
+            
+            if internal_callback:
+                await internal_callback(f"\n🔧 Wykonuję {len(commands)} funkcji (iteracja {iteration + 1}/{self.max_tool_iterations}): {commands}\n")
+            
+            tool_results = await self._execute_tools(
+                commands,
+                internal_callback,
+                lambda results, calls=tool_calls: self._append_tool_messages(calls, results)
+            )
+            self._append_tool_messages(tool_calls, tool_results)
+            
+            iteration += 1
+            generation = await self._generate(stream_callback, admission=False, tools=True)
+        
+        if generation.markers and not generation.tool_calls:
+            # Model użył komend tekstowych - obsłuż je jak w trybie markerów
+            return await self._respond(stream_callback, internal_callback, generation)
+        
+        await self._replay(generation, stream_callback)
+        self.history.append(AIMessage(content=generation.text))
+        return generation.text
     
     # History management methods
     
+    @property
+    def conversation_history(self) -> list:
+        """Messages currently sent to the model."""
+        return self.history.messages
+    
     def get_history(self) -> list:
         """Get the current conversation history."""
-        return self.conversation_history
+        return self.history.messages
     
     def clear_history(self, keep_system_prompt: bool = True):
         """
@@ -202,10 +581,7 @@ class ModelConnector:
         Args:
             keep_system_prompt: If True, keeps the system prompt
         """
-        if keep_system_prompt and len(self.conversation_history) > 0:
-            self.conversation_history = [self.conversation_history[0]]
-        else:
-            self.conversation_history = []
+        self.history.reset(keep_system_prompt)
     
     def set_system_prompt(self, prompt: str):
         """
@@ -214,31 +590,56 @@ class ModelConnector:
         Args:
             prompt: New system prompt text
         """
-        if (len(self.conversation_history) > 0 and 
-            isinstance(self.conversation_history[0], SystemMessage)):
-            self.conversation_history[0] = SystemMessage(content=prompt)
-        else:
-            self.conversation_history.insert(0, SystemMessage(content=prompt))
+        self.history.set_system_prompt(prompt)
     
     def get_stats(self) -> dict:
         """
         Get conversation statistics.
         
+        Counters are maintained incrementally, so this is O(1).
+        
         Returns:
             Dictionary with message counts by type
         """
+        counts = self.history.counts
         return {
-            "total_messages": len(self.conversation_history),
-            "user_messages": sum(
-                1 for msg in self.conversation_history 
-                if isinstance(msg, HumanMessage)
-            ),
-            "ai_messages": sum(
-                1 for msg in self.conversation_history 
-                if isinstance(msg, AIMessage)
-            ),
-            "system_messages": sum(
-                1 for msg in self.conversation_history 
-                if isinstance(msg, SystemMessage)
-            )
-        }
\ No newline at end of file
+            "total_messages": len(self.history),
+            "user_messages": counts["user"],
+            "ai_messages": counts["ai"],
+            "system_messages": counts["system"],
+            "estimated_tokens": self.history.token_count,
+            "compactions": self.history.compactions,
+            "cancelled_turns": self.cancelled_turns,
+            "usage": dict(self.usage)
+        }
+    
+    def export_state(self) -> dict:
+        """
+        Serialize per-session state for a session store.
+        
+        Returns:
+            JSON-serializable dictionary
+        """
+        return {
+            "version": self.state_version,
+            "history": self.history.to_dict(),
+            "cancelled_turns": self.cancelled_turns,
+            # Kopia - magazyn sesji serializuje stan w osobnym wątku
+            "usage": dict(self.usage)
+        }
+    
+    def restore_state(self, state: dict):
+        """
+        Restore per-session state saved with export_state.
+        
+        Args:
+            state: Dictionary produced by export_state
+        """
+        self.history.load_dict(state.get("history", {}))
+        self.state_version = state.get("version", 0)
+        self.cancelled_turns = state.get("cancelled_turns", 0)
+        self.usage.update(state.get("usage", {}))
+    
+    def estimated_memory_bytes(self) -> int:
+        """Approximate memory held by this session's history."""
+        return self.history.estimated_bytes()
@@ -0,0 +1,165 @@
+"""
+Speculative prefetch of tool results for PESEL numbers typed by the user.
+"""
+
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# "customer" - CHECK_CUSTOMER, "invoices" - także CHECK_INVOICES_BY_PESEL, "off" - wyłączone
+PREFETCH_MODE = os.environ.get("PREFETCH_MODE", "off").lower()
+# Maksymalna liczba numerów PESEL z jednej wiadomości, dla których robimy prefetch
+PREFETCH_MAX_PESELS = int(os.environ.get("PREFETCH_MAX_PESELS", "2"))
+
+PESEL_PATTERN = re.compile(r"(?<!\d)\d{11}(?!\d)")
+PESEL_WEIGHTS = (1, 3, 7, 9, 1, 3, 7, 9, 1, 3)
+
+_stats = {"turns": 0, "started": 0, "hits": 0, "wasted": 0}
+
+
+def is_valid_pesel(pesel: str) -> bool:
+    """
+    Check the PESEL control digit.
+    
+    Args:
+        pesel: 11-digit string
+        
+    Returns:
+        True if the checksum matches
+    """
+    if len(pesel) != 11 or not pesel.isdigit():
+        return False
+    total = sum(int(digit) * weight for digit, weight in zip(pesel, PESEL_WEIGHTS))
+    return (10 - total % 10) % 10 == int(pesel[10])
+
+
+def find_pesels(text: str) -> List[str]:
+    """
+    Find valid PESEL numbers in text (unique, in order of appearance).
+    
+    Args:
+        text: User message
+        
+    Returns:
+        List of PESEL strings
+    """
+    found = []
+    for candidate in PESEL_PATTERN.findall(text):
+        if candidate not in found and is_valid_pesel(candidate):
+            found.append(candidate)
+    return found
+
+
+def normalize_command(command: str) -> str:
+    """
+    Canonical form of a tool command used as the registry key.
+    
+    Args:
+        command: Tool command (e.g. "[check_customer:85010112345 ]")
+        
+    Returns:
+        Normalized command (e.g. "[CHECK_CUSTOMER: 85010112345]")
+    """
+    body = command.strip()[1:-1]
+    name, separator, args = body.partition(":")
+    name = name.strip().upper()
+    if not separator:
+        return f"[{name}]"
+    return f"[{name}: {', '.join(arg.strip() for arg in args.split(','))}]"
+
+
+class Prefetch:
+    """Tool results speculatively started for one turn, keyed by normalized command."""
+    
+    def __init__(self, executor: Callable[[str], Awaitable[str]]):
+        """
+        Initialize the registry.
+        
+        Args:
+            executor: Coroutine function executing a tool command
+        """
+        self._executor = executor
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
+    
+    @property
+    def commands(self) -> List[str]:
+        """Commands still waiting to be claimed."""
+        return list(self._tasks)
+    
+    def start(self, command: str):
+        """
+        Start executing a command in the background.
+        
+        Args:
+            command: Read-only tool command
+        """
+        key = normalize_command(command)
+        if key in self._tasks:
+            return
+        self._tasks[key] = asyncio.ensure_future(self._executor(command))
+        _stats["started"] += 1
+    
+    def claim(self, command: str) -> Optional[asyncio.Task]:
+        """
+        Take the prefetched execution of a command requested by the model.
+        
+        Args:
+            command: Tool command emitted by the model
+            
+        Returns:
+            Task producing the tool result, or None if not prefetched
+        """
+        task = self._tasks.pop(normalize_command(command), None)
+        if task is not None:
+            _stats["hits"] += 1
+        return task
+    
+    def finish(self):
+        """End of the turn: unclaimed results count as waste (they still warm the cache)."""
+        _stats["wasted"] += len(self._tasks)
+        self._tasks.clear()
+
+
+def start_prefetch(
+    text: str,
+    executor: Callable[[str], Awaitable[str]],
+    mode: str = PREFETCH_MODE
+) -> Optional[Prefetch]:
+    """
+    Start lookups for PESEL numbers found in a user message.
+    
+    Args:
+        text: User message
+        executor: Coroutine function executing a tool command
+        mode: "customer", "invoices" or "off"
+        
+    Returns:
+        Prefetch registry, or None when nothing was started
+    """
+    if mode == "off":
+        return None
+    
+    pesels = find_pesels(text)[:PREFETCH_MAX_PESELS]
+    if not pesels:
+        return None
+    
+    prefetch = Prefetch(executor)
+    for pesel in pesels:
+        prefetch.start(f"[CHECK_CUSTOMER: {pesel}]")
+        if mode == "invoices":
+            prefetch.start(f"[CHECK_INVOICES_BY_PESEL: {pesel}]")
+    _stats["turns"] += 1
+    return prefetch
+
+
+def get_prefetch_stats() -> dict:
+    """Get prefetch counters with hit and waste rates."""
+    stats = dict(_stats, mode=PREFETCH_MODE)
+    started = stats["started"]
+    stats["hit_rate"] = round(stats["hits"] / started, 3) if started else 0.0
+    stats["waste_rate"] = round(stats["wasted"] / started, 3) if started else 0.0
+    return stats
@@ -0,0 +1,129 @@
+"""
+Tail-latency protection primitives for backend calls.
+"""
+
+import time
+
+
+class RetryBudget:
+    """
+    Limits retries to a fraction of regular requests.
+    
+    Every request deposits `ratio` tokens (up to `max_tokens`), every retry
+    withdraws one. When the backend is failing broadly the budget drains
+    and retries stop, so they never multiply load during an incident.
+    """
+    
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        """
+        Initialize the budget.
+        
+        Args:
+            ratio: Retries allowed per request (e.g. 0.1 = 10%)
+            max_tokens: Maximum saved up retries (also the initial balance)
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.balance = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+    
+    def record_request(self):
+        """Deposit the share of one regular request."""
+        self.balance = min(self.max_tokens, self.balance + self.ratio)
+    
+    def try_spend(self) -> bool:
+        """
+        Take one retry from the budget.
+        
+        Returns:
+            True if the retry may be made
+        """
+        if self.balance < 1:
+            self.exhausted += 1
+            return False
+        self.balance -= 1
+        self.retries += 1
+        return True
+    
+    def get_stats(self) -> dict:
+        """Get budget counters."""
+        return {
+            "ratio": self.ratio,
+            "balance": round(self.balance, 2),
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated backend failures.
+    
+    closed: calls go through; `failure_threshold` consecutive failures open
+    the circuit. open: calls are rejected until `reset_timeout` passes.
+    half_open: one probe call is let through; success closes the circuit,
+    failure opens it again. A probe that never reports back (e.g. its turn
+    was cancelled) is replaced by a new one after another reset_timeout.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Initialize the breaker.
+        
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds before a probe call is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+    
+    def allow(self) -> bool:
+        """
+        Check whether a call may be made now.
+        
+        Returns:
+            False when the call should fail fast
+        """
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now >= self.retry_at:
+            self.state = self.HALF_OPEN
+            self.retry_at = now + self.reset_timeout
+            return True
+        self.rejected += 1
+        return False
+    
+    def record_success(self):
+        """A call succeeded: close the circuit."""
+        self.state = self.CLOSED
+        self.failures = 0
+    
+    def record_failure(self):
+        """A call failed: count it and open the circuit when needed."""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self.retry_at = time.monotonic() + self.reset_timeout
+    
+    def get_stats(self) -> dict:
+        """Get breaker state and counters."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in_seconds": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.state != self.CLOSED else 0.0,
+        }
@@ -0,0 +1,160 @@
+"""
+Process-wide admission control for LLM calls.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque
+
+# Maksymalna liczba równoległych wywołań modelu w procesie
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "32"))
+# Ile wywołań może czekać w kolejce, zanim odrzucimy nowe tury
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "256"))
+# Ile sekund nowa tura może czekać na miejsce
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "10"))
+
+
+class SchedulerBusyError(Exception):
+    """Raised when an LLM call cannot be admitted in time."""
+    
+    def __init__(self, reason: str):
+        super().__init__(f"LLM scheduler busy ({reason})")
+        self.reason = reason
+
+
+class LLMScheduler:
+    """
+    Limits concurrent model calls and hands out free slots fairly.
+    
+    Waiters are queued per session and served round-robin across sessions,
+    so one chatty session cannot starve the others. New turns are rejected
+    when the queue is full or their wait exceeds the queue timeout; calls
+    continuing an already admitted turn (tool follow-ups) always wait.
+    """
+    
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT
+    ):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            max_concurrency: Maximum number of concurrent model calls
+            max_queue: Maximum number of queued new turns
+            queue_timeout: Seconds a new turn may wait for a slot
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_wait = 0.0
+    
+    @asynccontextmanager
+    async def slot(self, session_id: str, admission: bool = True):
+        """
+        Hold one model call slot for the duration of the block.
+        
+        Args:
+            session_id: Session making the call (fairness key)
+            admission: False for follow-up calls of an admitted turn
+                (no queue limit and no timeout)
+                
+        Raises:
+            SchedulerBusyError: When a new turn cannot be admitted
+        """
+        await self._acquire(session_id, admission)
+        try:
+            yield
+        finally:
+            self._release()
+    
+    async def _acquire(self, session_id: str, admission: bool):
+        """Take a slot, waiting in the session's queue if necessary."""
+        if self.active < self.max_concurrency and not self._queued:
+            self.active += 1
+            self.admitted += 1
+            return
+        
+        if admission and self._queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusyError("queue_full")
+        
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(session_id, deque()).append(future)
+        self._queued += 1
+        started = time.monotonic()
+        
+        try:
+            if admission:
+                await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+            else:
+                await future
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Slot został przydzielony w tej samej chwili - oddaj go
+                self._release()
+            else:
+                future.cancel()
+                self._remove_waiter(session_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise SchedulerBusyError("queue_timeout") from None
+            raise
+        
+        self.max_wait = max(self.max_wait, time.monotonic() - started)
+        self.admitted += 1
+    
+    def _remove_waiter(self, session_id: str, future: asyncio.Future):
+        """Drop an abandoned waiter from its session queue."""
+        waiters = self._waiters.get(session_id)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        self._queued -= 1
+        if not waiters:
+            del self._waiters[session_id]
+    
+    def _release(self):
+        """Pass the slot to the next session in round-robin order or free it."""
+        while self._waiters:
+            session_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiters.move_to_end(session_id)
+            else:
+                del self._waiters[session_id]
+            
+            if not future.done():
+                # Slot przechodzi bezpośrednio na czekającego (active bez zmian)
+                future.set_result(None)
+                return
+        
+        self.active -= 1
+    
+    def get_stats(self) -> dict:
+        """Get scheduler counters."""
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "waiting_sessions": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "max_wait_seconds": round(self.max_wait, 3),
+        }
+
+
+llm_scheduler = LLMScheduler()
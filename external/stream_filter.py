@@ -0,0 +1,105 @@
+"""
+Incremental filter hiding tool markers in streamed model output.
+"""
+
+import re
+from typing import List
+
+from .tool_executor import ToolExecutor
+
+
+class ToolMarkerFilter:
+    """
+    Forwards streamed text as soon as it cannot be part of a tool marker.
+    
+    Only a pending "[" prefix that may still turn into a marker such as
+    "[CHECK_CUSTOMER: ...]" or "[GET_CATALOG: TV]" is held back. Complete
+    markers are swallowed and collected in `markers`.
+    """
+    
+    # Nazwy komend tak, jak występują zaraz po "["
+    MARKER_NAMES = (
+        "CHECK_CUSTOMER:",
+        "CHECK_INVOICES_BY_PESEL:",
+        "CHECK_INVOICES:",
+        "GET_CATALOG",
+        "CREATE_ORDER:",
+    )
+    
+    # Po tylu znakach bez "]" przestajemy wstrzymywać tekst
+    MAX_PENDING = 200
+    
+    MARKER_RE = re.compile(ToolExecutor.TOOL_PATTERN, re.IGNORECASE)
+    
+    def __init__(self):
+        self._pending = ''
+        self.markers: List[str] = []
+    
+    def _could_be_marker(self, text: str) -> bool:
+        """
+        Check whether an unterminated "[..." fragment may still become a marker.
+        
+        Args:
+            text: Fragment starting with "[" and not containing "]"
+            
+        Returns:
+            True if the fragment must be held back
+        """
+        if len(text) > self.MAX_PENDING:
+            return False
+        
+        body = text[1:].upper()
+        return any(
+            name.startswith(body) or body.startswith(name)
+            for name in self.MARKER_NAMES
+        )
+    
+    def feed(self, chunk: str) -> str:
+        """
+        Push a streamed chunk through the filter.
+        
+        Args:
+            chunk: Next piece of model output
+            
+        Returns:
+            Text that is safe to show to the client (may be empty)
+        """
+        text = self._pending + chunk
+        self._pending = ''
+        visible = []
+        pos = 0
+        
+        while True:
+            start = text.find('[', pos)
+            if start == -1:
+                visible.append(text[pos:])
+                break
+            
+            visible.append(text[pos:start])
+            end = text.find(']', start)
+            
+            if end == -1:
+                tail = text[start:]
+                if self._could_be_marker(tail):
+                    self._pending = tail
+                    break
+            elif self.MARKER_RE.fullmatch(text, start, end + 1):
+                self.markers.append(text[start:end + 1])
+                pos = end + 1
+                continue
+            
+            # To nie jest komenda - wypuść "[" i szukaj dalej
+            visible.append('[')
+            pos = start + 1
+        
+        return ''.join(visible)
+    
+    def flush(self) -> str:
+        """
+        Release any held back text at the end of the stream.
+        
+        Returns:
+            Pending text that never became a complete marker
+        """
+        pending, self._pending = self._pending, ''
+        return pending
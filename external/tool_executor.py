@@ -2,17 +2,124 @@
 Tool execution logic for MCP commands.
 """
 
+import os
 import re
 import json
+import asyncio
+import time
 from typing import List, Tuple, Optional, Callable
-from .mcp_server import check_customer, get_product_catalog, create_order, check_invoices, check_invoices_by_pesel
+from .mcp_server import (
+    run_check_customer, run_get_product_catalog, run_create_order, run_check_invoices, run_check_invoices_by_pesel
+)
+from .metrics import observe_tool
 
 
 class ToolExecutor:
     """Handles execution of MCP tool commands."""
     
     # Regex pattern for finding tool commands
-    TOOL_PATTERN = r'\[(?:CHECK_CUSTOMER:[^\]]+|GET_CATALOG|CREATE_ORDER:[^\]]+|CHECK_INVOICES:[^\]]+|CHECK_INVOICES_BY_PESEL:[^\]]+)\]'
+    TOOL_PATTERN = r'\[(?:CHECK_CUSTOMER:[^\]]+|GET_CATALOG(?::[^\]]*)?|CREATE_ORDER:[^\]]+|CHECK_INVOICES:[^\]]+|CHECK_INVOICES_BY_PESEL:[^\]]+)\]'
+    
+    # Komendy zmieniające stan - wykonywane po kolei, nigdy równolegle
+    WRITE_COMMANDS = ("[CREATE_ORDER:",)
+    # Nazwy narzędzi (etykiety metryk)
+    TOOL_NAMES = ("CHECK_CUSTOMER", "GET_CATALOG", "CREATE_ORDER", "CHECK_INVOICES", "CHECK_INVOICES_BY_PESEL")
+    
+    # Separator argumentów GET_CATALOG - przecinek przed cyfrą to przecinek dziesiętny (max=59,99)
+    CATALOG_ARG_SEPARATOR = re.compile(r",(?!\d)")
+    
+    # Maksymalna liczba narzędzi wykonywanych równolegle w jednej turze
+    MAX_CONCURRENCY = int(os.environ.get("TOOL_MAX_CONCURRENCY", "4"))
+    
+    # Format wyników przekazywanych modelowi: "compact" (key=value) lub "pretty" (emoji, ramki)
+    COMPACT_RESULTS = os.environ.get("TOOL_RESULTS_FORMAT", "pretty").lower() == "compact"
+    
+    # Schematy narzędzi dla natywnego function calling (TOOL_CALLING_MODE=native)
+    TOOL_SCHEMAS = [
+        {
+            "type": "function",
+            "function": {
+                "name": "check_customer",
+                "description": "Sprawdź klienta po numerze PESEL: dane, customer_id i aktywne usługi.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "pesel": {"type": "string", "description": "11-cyfrowy numer PESEL klienta"},
+                    },
+                    "required": ["pesel"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "check_invoices_by_pesel",
+                "description": "Sprawdź klienta i jego faktury jednym wywołaniem (po numerze PESEL).",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "pesel": {"type": "string", "description": "11-cyfrowy numer PESEL klienta"},
+                    },
+                    "required": ["pesel"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "check_invoices",
+                "description": "Pobierz faktury klienta o znanym customer_id.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "customer_id": {"type": "integer", "description": "ID klienta z check_customer"},
+                    },
+                    "required": ["customer_id"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_product_catalog",
+                "description": (
+                    "Pobierz katalog produktów (ID, nazwy, ceny priceMax/priceMin). "
+                    "Filtruj, gdy klient pyta o konkretny typ lub budżet - wynik jest wtedy krótszy."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "product_type": {
+                            "type": "string",
+                            "enum": ["MOBILE", "INTERNET", "TV"],
+                            "description": "Typ produktu",
+                        },
+                        "max_price": {"type": "number", "description": "Maksymalna cena priceMax w PLN/mies"},
+                        "top": {"type": "integer", "description": "Ile najtańszych produktów zwrócić"},
+                    },
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "create_order",
+                "description": "Złóż zamówienie. Używaj WYŁĄCZNIE po wyraźnym potwierdzeniu przez klienta.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "customer_id": {"type": "integer", "description": "ID klienta z check_customer"},
+                        "component_catalog_ids": {
+                            "type": "array",
+                            "items": {"type": "integer"},
+                            "description": "ID produktów z katalogu",
+                        },
+                    },
+                    "required": ["customer_id", "component_catalog_ids"],
+                },
+            },
+        },
+    ]
     
     @staticmethod
     def find_tool_commands(text: str) -> List[str]:
@@ -28,30 +135,133 @@ class ToolExecutor:
         return re.findall(ToolExecutor.TOOL_PATTERN, text, re.IGNORECASE)
     
     @staticmethod
-    async def execute_command(command: str) -> str:
+    def tool_call_to_command(name: str, args: dict) -> str:
+        """
+        Translate a native tool call into the equivalent text command.
+        
+        Native calls then share execute_commands (validation, concurrency,
+        write serialization) and result formatting with the marker mode.
+        
+        Args:
+            name: Function name from TOOL_SCHEMAS
+            args: Parsed call arguments
+            
+        Returns:
+            Tool command string (e.g., "[CHECK_CUSTOMER: 12345]")
+        """
+        args = args or {}
+        if name == "check_customer":
+            return f"[CHECK_CUSTOMER: {args.get('pesel', '')}]"
+        if name == "check_invoices_by_pesel":
+            return f"[CHECK_INVOICES_BY_PESEL: {args.get('pesel', '')}]"
+        if name == "check_invoices":
+            return f"[CHECK_INVOICES: {args.get('customer_id', '')}]"
+        if name == "get_product_catalog":
+            filters = [str(args["product_type"])] if args.get("product_type") else []
+            if args.get("max_price") is not None:
+                filters.append(f"max={args['max_price']}")
+            if args.get("top") is not None:
+                filters.append(f"top={args['top']}")
+            return f"[GET_CATALOG: {', '.join(filters)}]" if filters else "[GET_CATALOG]"
+        if name == "create_order":
+            ids = args.get("component_catalog_ids") or []
+            if not isinstance(ids, list):
+                ids = [ids]
+            return f"[CREATE_ORDER: {', '.join(str(v) for v in [args.get('customer_id', ''), *ids])}]"
+        return f"[{name}]"
+    
+    @staticmethod
+    def parse_catalog_filters(args: str) -> Tuple[Optional[str], Optional[float], Optional[int]]:
+        """
+        Parse GET_CATALOG arguments.
+        
+        Args:
+            args: Text after "GET_CATALOG:" (e.g., "TV, max=59,99, top=3")
+            
+        Returns:
+            Tuple of (product_type, max_price, top), None for a missing filter
+            
+        Raises:
+            ValueError: If an argument is unknown or not a valid number
+        """
+        product_type, max_price, top = None, None, None
+        for arg in filter(None, (a.strip() for a in ToolExecutor.CATALOG_ARG_SEPARATOR.split(args))):
+            key, separator, value = arg.partition('=')
+            key = key.strip().lower()
+            if not separator:
+                # Liczba bez nazwy to nie typ produktu (np. "max=59, 99")
+                if any(char.isdigit() for char in arg):
+                    raise ValueError(arg)
+                product_type = arg.upper()
+            elif key == "type":
+                product_type = value.strip().upper() or None
+            elif key in ("max", "max_price"):
+                max_price = float(value.strip().replace(',', '.'))
+            elif key == "top":
+                top = int(value.strip())
+                if top < 1:
+                    raise ValueError(arg)
+            else:
+                raise ValueError(arg)
+        return product_type, max_price, top
+    
+    @staticmethod
+    def tool_name(command: str) -> str:
+        """
+        Get the tool name of a command.
+        
+        Args:
+            command: Tool command string (e.g., "[CHECK_CUSTOMER: 12345]")
+            
+        Returns:
+            Name from TOOL_NAMES (e.g., "CHECK_CUSTOMER") or "unknown"
+        """
+        name = command.strip().lstrip("[").split(":", 1)[0].rstrip("]").strip().upper()
+        return name if name in ToolExecutor.TOOL_NAMES else "unknown"
+    
+    @staticmethod
+    async def execute_command(command: str, compact: Optional[bool] = None) -> str:
         """
-        Execute a single tool command.
+        Execute a single tool command (its duration is recorded per tool).
         
         Args:
             command: Tool command string (e.g., "[CHECK_CUSTOMER: 12345]")
+            compact: Use the compact result encoding (defaults to COMPACT_RESULTS)
             
         Returns:
             Result from the tool as a string
         """
+        started = time.perf_counter()
+        try:
+            return await ToolExecutor._run_command(command, compact)
+        finally:
+            observe_tool(ToolExecutor.tool_name(command), time.perf_counter() - started)
+    
+    @staticmethod
+    async def _run_command(command: str, compact: Optional[bool] = None) -> str:
+        """Dispatch a tool command to its MCP tool."""
+        if compact is None:
+            compact = ToolExecutor.COMPACT_RESULTS
+        
         try:
             # [CHECK_INVOICES_BY_PESEL: pesel]
             if command.upper().startswith("[CHECK_INVOICES_BY_PESEL:"):
                 pesel = command[25:-1].strip()
-                return await check_invoices_by_pesel(pesel)
+                return await run_check_invoices_by_pesel(pesel, compact=compact)
             
             # [CHECK_CUSTOMER: pesel]
             elif command.upper().startswith("[CHECK_CUSTOMER:"):
                 pesel = command[16:-1].strip()
-                return await check_customer(pesel)
+                return await run_check_customer(pesel, compact=compact)
             
-            # [GET_CATALOG]
+            # [GET_CATALOG] lub [GET_CATALOG: typ, max=cena, top=N]
             elif command.upper().startswith("[GET_CATALOG"):
-                return await get_product_catalog(None)
+                args = command[12:-1].lstrip(":")
+                try:
+                    product_type, max_price, top = ToolExecutor.parse_catalog_filters(args)
+                except ValueError:
+                    return f"❌ Nieprawidłowe parametry GET_CATALOG. Wymagane: [GET_CATALOG: typ, max=cena, top=liczba]. Otrzymano: {args.strip()}"
+                return await run_get_product_catalog(product_type, max_price, top, compact=compact)
             
             # [CREATE_ORDER: customer_id, product_id1, product_id2, ...]
             elif command.upper().startswith("[CREATE_ORDER:"):
@@ -65,7 +275,7 @@ class ToolExecutor:
                 try:
                     customer_id = int(params[0])
                     component_ids = [int(p) for p in params[1:]]
-                    return await create_order(customer_id, component_ids)
+                    return await run_create_order(customer_id, component_ids, compact=compact)
                 except ValueError:
                     return f"❌ Nieprawidłowe parametry CREATE_ORDER. Wymagane: liczby całkowite. Otrzymano: {params}"
             
@@ -74,7 +284,7 @@ class ToolExecutor:
                 customer_id_str = command[16:-1].strip()
                 try:
                     customer_id = int(customer_id_str)
-                    return await check_invoices(customer_id)
+                    return await run_check_invoices(customer_id, compact=compact)
                 except ValueError:
                     return f"❌ Nieprawidłowy customer_id dla CHECK_INVOICES. Wymagane: liczba całkowita. Otrzymano: {customer_id_str}"
             
@@ -86,6 +296,85 @@ class ToolExecutor:
         except Exception as e:
             return f"❌ Błąd wykonania narzędzia: {str(e)}"
     
+    @staticmethod
+    def is_write_command(command: str) -> bool:
+        """
+        Check whether a command changes backend state.
+        
+        Args:
+            command: Tool command string
+            
+        Returns:
+            True for commands that must run serialized (e.g. CREATE_ORDER)
+        """
+        return command.upper().startswith(ToolExecutor.WRITE_COMMANDS)
+    
+    @staticmethod
+    async def execute_commands(
+        commands: List[str],
+        callback: Optional[Callable[[str], None]] = None,
+        max_concurrency: Optional[int] = None,
+        prefetch=None
+    ) -> List[Tuple[str, str]]:
+        """
+        Execute tool commands, running read-only ones concurrently.
+        
+        Commands are split into batches at every write command (CREATE_ORDER).
+        Read-only commands of a batch fan out with asyncio.gather, bounded by
+        max_concurrency; each write runs alone after the reads emitted before
+        it, so reads emitted after a write see its effect.
+        
+        Args:
+            commands: Tool command strings in the order the model emitted them
+            callback: Optional async callback for streaming progress
+            max_concurrency: Per-turn concurrency cap (defaults to MAX_CONCURRENCY)
+            prefetch: Optional Prefetch registry with results started ahead of time
+            
+        Returns:
+            List of (command, result) tuples in the original command order
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or ToolExecutor.MAX_CONCURRENCY))
+        
+        async def run(command: str, use_prefetch: bool = True) -> str:
+            prefetched = prefetch.claim(command) if prefetch and use_prefetch else None
+            if prefetched is not None:
+                result = await prefetched
+                if callback:
+                    await callback(f"⚡ Wynik z prefetchu {command} ({len(result)} znaków)\n")
+                return result
+            
+            async with semaphore:
+                if callback:
+                    await callback(f"\n🔧 Wykonuję narzędzie: {command}\n")
+                
+                result = await ToolExecutor.execute_command(command)
+                
+                if callback:
+                    await callback(f"✅ Otrzymano wynik {command} ({len(result)} znaków)\n")
+                return result
+        
+        results: List[Optional[str]] = [None] * len(commands)
+        reads: List[int] = []
+        written = False
+        
+        async def run_reads():
+            # Wyniki z prefetchu pochodzą sprzed zapisu - po zapisie odczyt idzie do backendu
+            read_results = await asyncio.gather(*(run(commands[i], not written) for i in reads))
+            for i, result in zip(reads, read_results):
+                results[i] = result
+            reads.clear()
+        
+        for i, command in enumerate(commands):
+            if ToolExecutor.is_write_command(command):
+                await run_reads()
+                results[i] = await run(command)
+                written = True
+            else:
+                reads.append(i)
+        await run_reads()
+        
+        return list(zip(commands, results))
+    
     @staticmethod
     async def execute_all_commands(
         text: str, 
@@ -106,31 +395,25 @@ class ToolExecutor:
         if not commands:
             return []
         
-        results = []
-        for command in commands:
-            if callback:
-                await callback(f"\n🔧 Wykonuję narzędzie: {command}\n")
-            
-            result = await ToolExecutor.execute_command(command)
-            results.append((command, result))
-            
-            if callback:
-                await callback(f"✅ Otrzymano wynik ({len(result)} znaków)\n")
-        
-        return results
+        return await ToolExecutor.execute_commands(commands, callback)
     
     @staticmethod
-    def format_tool_results(results: List[Tuple[str, str]]) -> str:
+    def format_tool_results(results: List[Tuple[str, str]], compact: Optional[bool] = None) -> str:
         """
         Format tool results for inclusion in prompt.
         
         Args:
             results: List of (command, result) tuples
+            compact: Join results without blank lines (defaults to COMPACT_RESULTS)
             
         Returns:
             Formatted string with all results
         """
-        return "\n\n".join([
-            f"WYNIK NARZĘDZIA {cmd}:\n{res}" 
+        if compact is None:
+            compact = ToolExecutor.COMPACT_RESULTS
+        
+        separator = "\n" if compact else "\n\n"
+        return separator.join([
+            f"WYNIK NARZĘDZIA {cmd}:\n{res.strip() if compact else res}" 
             for cmd, res in results
         ])
\ No newline at end of file